@@ -1,6 +1,36 @@
-import whisper
 import os
 import time
+import wave
+import queue
+import threading
+
+import numpy as np
+
+from vad import VadSegmenter
+
+SAMPLE_RATE = 16000  # Whisper 输入采样率
+_models = {}
+_models_lock = threading.Lock()
+
+
+def load_model(model_name="base", threads=None):
+    """加载并缓存 Whisper 模型, 同一进程内每个模型只加载一次
+
+    whisper/torch 导入需要数秒, 因此在首次加载模型时才导入。
+    """
+    import whisper
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+    with _models_lock:
+        model = _models.get(model_name)
+        if model is None:
+            print(f"加载 Whisper 模型: {model_name}")
+            start_time = time.time()
+            model = whisper.load_model(model_name)  # 可选模型: tiny, base, small, medium, large
+            print(f"模型加载耗时: {time.time() - start_time:.2f} 秒")
+            _models[model_name] = model
+    return model
 
 def convert_audio_to_text(input_file="ds_e12_output.wav", model_name="base"):
     """使用 Whisper 将 WAV 音频文件转换为文本"""
@@ -9,10 +39,9 @@ def convert_audio_to_text(input_file="ds_e12_output.wav", model_name="base"):
         print(f"错误：音频文件 {input_file} 不存在")
         return
 
-    # 加载 Whisper 模型
+    # 加载 Whisper 模型 (已加载过则复用)
     try:
-        print(f"加载 Whisper 模型: {model_name}")
-        model = whisper.load_model(model_name)  # 可选模型: tiny, base, small, medium, large
+        model = load_model(model_name)
     except Exception as e:
         print(f"加载 Whisper 模型失败: {e}")
         return
@@ -29,5 +58,139 @@ def convert_audio_to_text(input_file="ds_e12_output.wav", model_name="base"):
     convert_time = time.time() - start_time
     print("转录完成，耗时: {:.2f} 秒".format(convert_time))
 
+
+class Transcript:
+    """一段语音的识别结果: 文本、在音频流中的起始时间与时长、转录耗时及实时率 (耗时 / 时长)"""
+
+    __slots__ = ("text", "start", "duration", "elapsed", "forced")
+
+    def __init__(self, text, start, duration, elapsed, forced=False):
+        self.text = text
+        self.start = start
+        self.duration = duration
+        self.elapsed = elapsed
+        self.forced = forced
+
+    @property
+    def rtf(self):
+        return self.elapsed / self.duration if self.duration else 0.0
+
+
+class ASRWorker:
+    """常驻的流式语音识别线程
+
+    启动时加载一次模型; submit 接收 PCM 块 (int16 bytes / int16 或 float32 数组, 16 kHz 单声道),
+    在调用线程中经 VadSegmenter 切分 (开销很小), 完成的语音段交给识别线程立即转录, 转录期间不会丢音频。
+    超过 window_s 的长语音按滑动窗口强制切分 (相邻窗口重叠 overlap_s 秒)。
+    结果放入 results 队列, 并可通过 on_result 回调接收。
+    """
+
+    def __init__(self, model_name="base", threads=None, language="zh", window_s=25.0, overlap_s=1.0,
+                 vad=None, on_result=None, max_pending=8):
+        self.model_name = model_name
+        self.threads = threads
+        self.language = language
+        self.vad = vad or VadSegmenter(SAMPLE_RATE, max_segment_s=window_s, overlap_s=overlap_s)
+        self.on_result = on_result
+        self.results = queue.Queue()
+        self.segments = 0
+        self.audio_seconds = 0.0
+        self.busy_seconds = 0.0
+        self.dropped = 0
+        self._segments = queue.Queue(maxsize=max_pending)
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self.model = None
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def wait_ready(self, timeout=None):
+        """等待模型加载完成"""
+        return self._ready.wait(timeout)
+
+    def submit(self, pcm):
+        """投递一块音频, 不等待转录; 积压的语音段过多时丢弃最旧的一段"""
+        if isinstance(pcm, (bytes, bytearray, memoryview)):
+            pcm = np.frombuffer(pcm, dtype=np.int16)
+        if pcm.dtype == np.int16:
+            pcm = pcm.astype(np.float32) / 32768.0  # 与 record.py 相同的归一化
+        for segment in self.vad.feed(pcm):
+            self._enqueue(segment)
+
+    def submit_segment(self, segment):
+        """直接投递已切分好的语音段 (例如 record.py 的流式采集输出)"""
+        self._enqueue(segment)
+
+    def _enqueue(self, segment):
+        while True:
+            try:
+                self._segments.put_nowait(segment)
+                return
+            except queue.Full:
+                try:
+                    self._segments.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def close(self, timeout=None):
+        """结束输入, 转录最后一段未结束的语音后退出"""
+        for segment in self.vad.flush():
+            self._enqueue(segment)
+        self._segments.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        self.model = load_model(self.model_name, self.threads)
+        self._ready.set()
+        while True:
+            segment = self._segments.get()
+            if segment is None:
+                return
+            self._transcribe(segment)
+
+    def _transcribe(self, segment):
+        start_time = time.time()
+        try:
+            result = self.model.transcribe(segment.samples, language=self.language, fp16=False)
+            text = result["text"].strip()
+        except Exception as e:
+            print(f"转录音频时出错: {e}")
+            return
+        transcript = Transcript(text, segment.start, segment.duration, time.time() - start_time, segment.forced)
+        self.segments += 1
+        self.audio_seconds += transcript.duration
+        self.busy_seconds += transcript.elapsed
+        print(f"[asr] {transcript.start:.2f}s +{transcript.duration:.2f}s 耗时 {transcript.elapsed:.2f}s "
+              f"RTF {transcript.rtf:.2f}: {text}")
+        self.results.put(transcript)
+        if self.on_result is not None:
+            self.on_result(transcript)
+
+    def summary(self):
+        rtf = self.busy_seconds / self.audio_seconds if self.audio_seconds else 0.0
+        return (f"asr: {self.segments} 段, 音频 {self.audio_seconds:.1f}s, 转录 {self.busy_seconds:.1f}s, "
+                f"平均 RTF {rtf:.2f}, 丢弃 {self.dropped} 段")
+
+
+def transcribe_wav_streaming(input_file, model_name="base", threads=None, chunk_size=1600):
+    """把 WAV 文件按 chunk_size 分块送入 ASRWorker, 模拟麦克风流式输入"""
+    worker = ASRWorker(model_name, threads).start()
+    worker.wait_ready()
+    with wave.open(input_file, "rb") as wf:
+        if wf.getframerate() != SAMPLE_RATE or wf.getnchannels() != 1 or wf.getsampwidth() != 2:
+            print(f"错误：需要 16 kHz 单声道 16-bit WAV: {input_file}")
+            worker.close()
+            return
+        while True:
+            data = wf.readframes(chunk_size)
+            if not data:
+                break
+            worker.submit(data)
+    worker.close()
+    print(worker.summary())
+
 if __name__ == "__main__":
-    convert_audio_to_text()
\ No newline at end of file
+    convert_audio_to_text()
@@ -1,7 +1,10 @@
 import pyaudio
 import wave
+import threading
 import numpy as np
 
+from vad import VadSegmenter
+
 
 def record_audio(device_index=0, sample_rate=16000, channels=1, chunk_size=1600, duration=5, output_file="ds_e12_output.wav"):
     """使用指定设备录制音频并保存为 WAV 文件"""
@@ -72,5 +75,125 @@ def record_audio(device_index=0, sample_rate=16000, channels=1, chunk_size=1600,
     p.terminate()
     print("音频资源已清理")
 
+
+class MicStream:
+    """连续麦克风采集: pyaudio 回调把 int16 音频直接换算写入预分配的 float32 环形缓冲区
+
+    回调中只做一次就地换算 (np.multiply(..., out=环形缓冲区切片)), 不分配 Python 列表;
+    消费线程调用 segments() 读取新数据交给 VadSegmenter, 每段语音结束即返回, 内存占用固定,
+    可全天运行。消费落后超过 ring_seconds 时跳过被覆盖的数据并计入 overruns。
+    """
+
+    def __init__(self, device_index=0, sample_rate=16000, chunk_size=1600, ring_seconds=10, vad=None):
+        self.device_index = device_index
+        self.sample_rate = sample_rate
+        self.chunk_size = chunk_size
+        self.ring = np.zeros(int(sample_rate * ring_seconds), dtype=np.float32)
+        self.vad = vad or VadSegmenter(sample_rate)
+        self.written = 0  # 累计写入的采样数
+        self.overruns = 0
+        self._read = 0
+        self._cond = threading.Condition()
+        self._running = False
+        self._pyaudio = None
+        self._stream = None
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        samples = np.frombuffer(in_data, dtype=np.int16)
+        size = len(self.ring)
+        pos = self.written % size
+        first = min(len(samples), size - pos)
+        np.multiply(samples[:first], 1.0 / 32768.0, out=self.ring[pos:pos + first], casting="unsafe")
+        if first < len(samples):
+            np.multiply(samples[first:], 1.0 / 32768.0, out=self.ring[:len(samples) - first], casting="unsafe")
+        with self._cond:
+            self.written += len(samples)
+            self._cond.notify()
+        return None, pyaudio.paContinue
+
+    def start(self):
+        self._pyaudio = pyaudio.PyAudio()
+        self._stream = self._pyaudio.open(
+            format=pyaudio.paInt16,
+            channels=1,
+            rate=self.sample_rate,
+            input=True,
+            input_device_index=self.device_index,
+            frames_per_buffer=self.chunk_size,
+            stream_callback=self._callback,
+        )
+        self._running = True
+        self._stream.start_stream()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._stream is not None:
+            self._stream.stop_stream()
+            self._stream.close()
+            self._stream = None
+        if self._pyaudio is not None:
+            self._pyaudio.terminate()
+            self._pyaudio = None
+
+    def read_new(self, timeout=1.0):
+        """等待并返回自上次读取以来的新采样 (环形缓冲区的副本, 绕回时为两段)
+
+        回调先写入环形缓冲区再增加 written, 复制完成后重新检查 written: 复制期间可能已被覆盖的开头部分
+        (含正在写入的一个回调块) 被丢弃并计入 overruns, 保证返回的数据不会被回调改写。
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self.written > self._read or not self._running, timeout)
+            written = self.written
+        size = len(self.ring)
+        if written - self._read > size:
+            self.overruns += 1
+            self._read = written - size
+        start, end = self._read % size, self._read % size + (written - self._read)
+        if end <= size:
+            parts = [self.ring[start:end].copy()]
+        else:
+            parts = [self.ring[start:].copy(), self.ring[:end - size].copy()]
+        with self._cond:
+            latest = self.written
+        stale = latest + self.chunk_size - size - self._read
+        self._read = written
+        if stale <= 0:
+            return parts
+        self.overruns += 1
+        if stale >= len(parts[0]):
+            return [parts[1][stale - len(parts[0]):]] if len(parts) > 1 else []
+        return [parts[0][stale:]] + parts[1:]
+
+    def segments(self):
+        """生成器: 持续读取音频并返回完成的语音段 (vad.Segment), stop() 后输出最后一段并结束"""
+        while True:
+            running = self._running
+            for part in self.read_new():
+                if len(part):
+                    yield from self.vad.feed(part)
+            if not running:
+                yield from self.vad.flush()
+                return
+
+
+def stream_segments(device_index=0, sample_rate=16000, chunk_size=1600, on_segment=None):
+    """持续采集并按语音段输出, 直到 Ctrl+C; on_segment 为空时只打印每段信息"""
+    mic = MicStream(device_index, sample_rate, chunk_size).start()
+    print(f"开始连续采集 (设备索引 {device_index}), Ctrl+C 结束")
+    try:
+        for segment in mic.segments():
+            if on_segment is not None:
+                on_segment(segment)
+            else:
+                print(f"语音段: 起始 {segment.start:.2f}s, 时长 {segment.duration:.2f}s")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mic.stop()
+        print(f"音频资源已清理, 缓冲区溢出 {mic.overruns} 次")
+
 if __name__ == "__main__":
     record_audio(device_index=25)  # 指定 DS-E12 麦克风（索引 25）
\ No newline at end of file
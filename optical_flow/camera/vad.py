@@ -0,0 +1,135 @@
+import collections
+
+import numpy as np
+
+
+class Segment:
+    """一段语音: float32 采样、起始时间 (秒, 相对采集开始) 以及是否因超长被强制切分"""
+
+    __slots__ = ("samples", "start", "sample_rate", "forced")
+
+    def __init__(self, samples, start, sample_rate=16000, forced=False):
+        self.samples = samples
+        self.start = start
+        self.sample_rate = sample_rate
+        self.forced = forced
+
+    @property
+    def duration(self):
+        return len(self.samples) / self.sample_rate
+
+    def __repr__(self):
+        return f"Segment(start={self.start:.2f}s, samples={len(self.samples)}, forced={self.forced})"
+
+
+class VadSegmenter:
+    """基于短时能量的流式语音切分
+
+    按 frame_ms 分帧计算 RMS, 语音阈值为 max(threshold, 噪声底 x noise_ratio), 噪声底在静音时自适应更新。
+    检测到语音后带上 pre_roll_ms 的前导音频开始一段, 连续 hangover_ms 静音后结束并返回该段;
+    超过 max_segment_s 时强制切分, 并保留 overlap_s 的重叠音频接到下一段 (滑动窗口)。
+    短于 min_speech_ms 的片段视为噪声丢弃。
+    """
+
+    def __init__(self, sample_rate=16000, frame_ms=30, threshold=0.01, noise_ratio=3.0,
+                 hangover_ms=500, pre_roll_ms=300, min_speech_ms=250, max_segment_s=25.0, overlap_s=1.0):
+        self.sample_rate = sample_rate
+        self.frame_len = int(sample_rate * frame_ms / 1000)
+        self.threshold = threshold
+        self.noise_ratio = noise_ratio
+        self.noise_floor = threshold / noise_ratio
+        self.hangover_frames = max(1, int(hangover_ms / frame_ms))
+        self.min_speech_frames = max(1, int(min_speech_ms / frame_ms))
+        self.max_segment_frames = max(1, int(max_segment_s * 1000 / frame_ms))
+        self.overlap_frames = int(overlap_s * 1000 / frame_ms)
+        self._pre_roll = collections.deque(maxlen=max(0, int(pre_roll_ms / frame_ms)))
+        self._partial = np.empty(self.frame_len, dtype=np.float32)
+        self._partial_len = 0
+        self._frames = []
+        self._speech_frames = 0
+        self._silence_run = 0
+        self._segment_start = 0
+        self._consumed = 0  # 已分帧的采样数
+        self.in_speech = False
+
+    def is_speech(self, frame):
+        rms = float(np.sqrt(np.dot(frame, frame) / len(frame)))
+        speech = rms > max(self.threshold, self.noise_floor * self.noise_ratio)
+        if not speech and not self.in_speech:
+            self.noise_floor = 0.95 * self.noise_floor + 0.05 * rms
+        return speech
+
+    def feed(self, samples):
+        """输入任意长度的 float32 采样, 返回本次完成的 Segment 列表"""
+        segments = []
+        samples = np.asarray(samples, dtype=np.float32)
+        pos = 0
+        if self._partial_len:
+            need = self.frame_len - self._partial_len
+            take = samples[:need]
+            self._partial[self._partial_len:self._partial_len + len(take)] = take
+            self._partial_len += len(take)
+            pos = len(take)
+            if self._partial_len < self.frame_len:
+                return segments
+            self._process_frame(self._partial.copy(), segments)
+            self._partial_len = 0
+        while pos + self.frame_len <= len(samples):
+            self._process_frame(samples[pos:pos + self.frame_len].copy(), segments)
+            pos += self.frame_len
+        rest = len(samples) - pos
+        if rest:
+            self._partial[:rest] = samples[pos:]
+            self._partial_len = rest
+        return segments
+
+    def flush(self):
+        """结束输入时调用, 返回尚未结束的语音段 (如果足够长)"""
+        segments = []
+        if self.in_speech:
+            self._finish(segments, forced=False)
+        return segments
+
+    def _process_frame(self, frame, segments):
+        frame_start = self._consumed
+        self._consumed += self.frame_len
+        speech = self.is_speech(frame)
+        if not self.in_speech:
+            if speech:
+                self.in_speech = True
+                self._frames = list(self._pre_roll)
+                self._segment_start = frame_start - len(self._frames) * self.frame_len
+                self._pre_roll.clear()
+                self._frames.append(frame)
+                self._speech_frames = 1
+                self._silence_run = 0
+            else:
+                self._pre_roll.append(frame)
+            return
+        self._frames.append(frame)
+        if speech:
+            self._speech_frames += 1
+            self._silence_run = 0
+        else:
+            self._silence_run += 1
+        if self._silence_run >= self.hangover_frames:
+            self._finish(segments, forced=False)
+        elif len(self._frames) >= self.max_segment_frames:
+            self._finish(segments, forced=True)
+
+    def _finish(self, segments, forced):
+        frames = self._frames
+        if self._speech_frames >= self.min_speech_frames:
+            segments.append(Segment(np.concatenate(frames), self._segment_start / self.sample_rate,
+                                    self.sample_rate, forced))
+        if forced:
+            # 超长语音强制切分: 保留末尾 overlap 帧作为下一段开头, 避免切断词语
+            kept = frames[-self.overlap_frames:] if self.overlap_frames else []
+            self._frames = list(kept)
+            self._segment_start = self._consumed - len(kept) * self.frame_len
+            self._speech_frames = len(kept)
+            return
+        self._frames = []
+        self._speech_frames = 0
+        self._silence_run = 0
+        self.in_speech = False
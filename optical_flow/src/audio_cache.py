@@ -0,0 +1,170 @@
+import os
+import json
+import time
+import queue
+import hashlib
+import threading
+
+INDEX_FILE = "index.json"
+
+
+def cache_key(*parts) -> str:
+    """对任意可 JSON 序列化的内容计算内容地址"""
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+def _write_atomic(path, data: bytes):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(data)
+    os.replace(tmp_path, path)
+
+
+class AudioCache:
+    """按 判定 + voice_id + emotion + audio_setting 分池的预合成评论语音磁盘缓存
+
+    每个池保留 variants 条不同评论; 取用时优先播放次数最少的一条, 并在后台线程
+    调用 generate(verdict, voice) -> (评论文本, 音频) 补充一条新变体, 池超出容量时
+    淘汰播放次数最多的旧变体。缓存总大小超过 max_bytes 时按最近最少使用淘汰。
+    变体以 池 + 音频内容哈希 为键, 文本相同的变体不会互相覆盖, 完全相同的音频只保存一份。
+    deterministic=True 表示 generate 的文本由判定唯一确定 (不经过 LLM), 再合成也得不到新变体,
+    此时每个池只保留一条且命中后不补充。
+    """
+
+    def __init__(self, cache_dir, generate, audio_setting, variants=3, max_bytes=50 * 1024 * 1024,
+                 deterministic=False):
+        self.cache_dir = cache_dir
+        self.generate = generate
+        self.audio_setting = audio_setting
+        self.deterministic = deterministic
+        self.variants = 1 if deterministic else variants
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._requests = queue.Queue()
+        self._worker = None
+        os.makedirs(cache_dir, exist_ok=True)
+        self._index = self._load_index()
+
+    def _load_index(self):
+        path = os.path.join(self.cache_dir, INDEX_FILE)
+        if not os.path.exists(path):
+            return {}
+        with open(path, "r", encoding="utf-8") as file:
+            index = json.load(file)
+        # 丢弃音频文件已不存在的条目
+        return {key: entry for key, entry in index.items()
+                if os.path.exists(os.path.join(self.cache_dir, entry["file"]))}
+
+    def _save_index(self):
+        data = json.dumps(self._index, ensure_ascii=False, indent=1).encode("utf-8")
+        _write_atomic(os.path.join(self.cache_dir, INDEX_FILE), data)
+
+    def pool_key(self, verdict, voice) -> str:
+        voice_id, voice_params = voice
+        return cache_key(verdict, voice_id, voice_params.get("emotion"), self.audio_setting)
+
+    def _pool(self, pool):
+        return [(key, entry) for key, entry in self._index.items() if entry["pool"] == pool]
+
+    def get(self, verdict, voice):
+        """取一条缓存语音, 返回 (评论文本, 音频) 或 None
+
+        命中时安排后台补充一条新变体 (deterministic 时不补充); 未命中时调用方会现场合成并 put, 不再重复合成。
+        """
+        pool = self.pool_key(verdict, voice)
+        with self._lock:
+            entries = self._pool(pool)
+            hit = None
+            if entries:
+                key, entry = min(entries, key=lambda item: (item[1]["plays"], item[1]["last_used"]))
+                with open(os.path.join(self.cache_dir, entry["file"]), "rb") as file:
+                    audio = file.read()
+                entry["plays"] += 1
+                entry["last_used"] = time.time()
+                self._save_index()
+                hit = entry["text"], audio
+        if hit is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            if not self.deterministic:
+                self.refill(verdict, voice)
+        return hit
+
+    def put(self, verdict, voice, text, audio: bytes):
+        """写入一条变体, 按池容量和总大小淘汰旧条目; 池中已有相同音频时忽略"""
+        voice_id, _ = voice
+        pool = self.pool_key(verdict, voice)
+        key = cache_key(pool, hashlib.sha256(audio).hexdigest())
+        file_name = f"{key}.mp3"
+        with self._lock:
+            if key in self._index:
+                return
+            _write_atomic(os.path.join(self.cache_dir, file_name), bytes(audio))
+            now = time.time()
+            self._index[key] = {
+                "pool": pool, "verdict": verdict, "voice_id": voice_id, "text": text,
+                "file": file_name, "size": len(audio), "plays": 0, "created": now, "last_used": now,
+            }
+            entries = self._pool(pool)
+            while len(entries) > self.variants:
+                stale_key, _ = max(entries, key=lambda item: (item[1]["plays"], -item[1]["last_used"]))
+                self._evict(stale_key)
+                entries = self._pool(pool)
+            while sum(entry["size"] for entry in self._index.values()) > self.max_bytes and len(self._index) > 1:
+                lru_key = min(self._index, key=lambda k: self._index[k]["last_used"])
+                self._evict(lru_key)
+            self._save_index()
+
+    def _evict(self, key):
+        entry = self._index.pop(key)
+        try:
+            os.remove(os.path.join(self.cache_dir, entry["file"]))
+        except FileNotFoundError:
+            pass
+
+    def count(self, verdict, voice) -> int:
+        with self._lock:
+            return len(self._pool(self.pool_key(verdict, voice)))
+
+    def refill(self, verdict, voice, n=1):
+        """安排后台生成 n 条新变体; 同一个池同时只排队一批"""
+        pool = self.pool_key(verdict, voice)
+        with self._lock:
+            if pool in self._pending:
+                return
+            self._pending.add(pool)
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._refill_loop, daemon=True)
+            self._worker.start()
+        self._requests.put((pool, verdict, voice, n))
+
+    def prefill(self, verdicts, voice):
+        """启动时为每个判定补足 variants 条变体"""
+        for verdict in verdicts:
+            missing = self.variants - self.count(verdict, voice)
+            if missing > 0:
+                self.refill(verdict, voice, missing)
+
+    def _refill_loop(self):
+        while True:
+            pool, verdict, voice, n = self._requests.get()
+            try:
+                for _ in range(n):
+                    text, audio = self.generate(verdict, voice)
+                    if audio:
+                        self.put(verdict, voice, text, audio)
+            except Exception as e:
+                print(f"缓存语音生成失败: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(pool)
+
+    def summary(self):
+        with self._lock:
+            size = sum(entry["size"] for entry in self._index.values())
+            count = len(self._index)
+        return f"audio cache: 命中 {self.hits}, 未命中 {self.misses}, {count} 条, {size / 1024:.0f} KB"
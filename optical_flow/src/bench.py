@@ -0,0 +1,335 @@
+import os
+import csv
+import json
+import time
+import argparse
+import tempfile
+
+import cv2
+import numpy as np
+
+from capture import mjpeg_reduction, open_mjpeg_capture
+from detector_config import DetectorParams
+from preprocess import FLOW_BACKENDS, STAGES, JetDetector, calibrate_flow_backend, print_calibration
+from tracker import TRACKERS
+
+DEMO_VIDEOS = [
+    "./demo/normal.mp4",
+    "./demo/long.mp4",
+    "./demo/move_sudden.mp4",
+    "./demo/demo_hard.mp4",
+]
+TRACE_FIELDS = ["video", "frame", "x", "y", "text", "emit"]
+
+
+def trace_row(video_path, frame, point, text, emit):
+    """落点轨迹中的一行"""
+    return {
+        "video": os.path.basename(video_path),
+        "frame": frame,
+        "x": None if point is None else int(point[0]),
+        "y": None if point is None else int(point[1]),
+        "text": text,
+        "emit": bool(emit),
+    }
+
+def _open_video(video_path, mjpeg_gray=False, scale=0.5):
+    """打开视频, 返回 (cap, input_reduction); mjpeg_gray 时读取原始 MJPEG 并直接解码为低分辨率灰度"""
+    if mjpeg_gray:
+        reduction = mjpeg_reduction(scale)
+        cap = open_mjpeg_capture(video_path, reduction=reduction)
+        if cap is None:
+            raise RuntimeError(f"不是 MJPEG 视频: {video_path}")
+        return cap, reduction
+    return cv2.VideoCapture(video_path), 1
+
+def evaluate_video(video_path, scale=0.5, max_history=5, roi=False, roi_padding=120, motion_gate=False,
+                   flow_backend="dis_fast", mjpeg_gray=False, tracker="average"):
+    """离线逐帧跑检测 (不限速、不回绕), 返回耗时统计与落点轨迹"""
+    cap, input_reduction = _open_video(video_path, mjpeg_gray, scale)
+    ret, first_frame = cap.read()
+    if not ret:
+        cap.release()
+        raise RuntimeError(f"无法读取视频文件: {video_path}")
+
+    params = DetectorParams(scale=scale, max_history=max_history, tracker=tracker)
+    detector = JetDetector(first_frame, roi=roi, roi_padding=roi_padding, motion_gate=motion_gate,
+                           flow_backend=flow_backend, params=params, input_reduction=input_reduction)
+    stage_samples = []
+    read_samples = []
+    trace = []
+    measured = []
+    start_time = time.perf_counter()
+    while True:
+        t0 = time.perf_counter()
+        ret, frame = cap.read()
+        if not ret:
+            break
+        read_samples.append(time.perf_counter() - t0)
+        point, text, emit = detector.process(frame)
+        stage_samples.append(detector.stage_times.copy())
+        trace.append(trace_row(video_path, detector.frame_count, point, text, emit))
+        raw = detector.measured_point
+        measured.append(None if raw is None else (np.array(raw) / detector.scale).astype(int) + detector.roi_offset)
+    total = time.perf_counter() - start_time
+    cap.release()
+
+    frames = len(trace)
+    stage_samples = np.array(stage_samples).reshape(frames, len(STAGES)) * 1000
+    stages = {"read": _summarize(np.array(read_samples) * 1000)}
+    for i, name in enumerate(STAGES):
+        stages[name] = _summarize(stage_samples[:, i])
+    return {
+        "video": video_path,
+        "flow_backend": flow_backend,
+        "decode": "mjpeg_gray" if mjpeg_gray else "bgr",
+        "tracker": tracker,
+        "tracking_error_px": tracking_error(measured, trace),
+        "frames": frames,
+        "seconds": total,
+        "fps": frames / total if total > 0 else 0.0,
+        "detect_fps": frames / (stage_samples.sum() / 1000) if frames else 0.0,
+        "stages_ms": stages,
+        "skip_ratio": detector.gate.skip_ratio if detector.gate is not None else 0.0,
+        "trace": trace,
+    }
+
+def read_frames(video_path, count, mjpeg_gray=False, scale=0.5):
+    """读取视频开头 count 帧, 用于光流后端标定"""
+    cap, _ = _open_video(video_path, mjpeg_gray, scale)
+    frames = []
+    while len(frames) < count:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+def _summarize(samples_ms):
+    if len(samples_ms) == 0:
+        return {"mean": 0.0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+    return {
+        "mean": float(np.mean(samples_ms)),
+        "p50": float(np.percentile(samples_ms, 50)),
+        "p95": float(np.percentile(samples_ms, 95)),
+        "max": float(np.max(samples_ms)),
+    }
+
+def encode_mjpeg(video_path, output_dir=None):
+    """把视频重新编码为 MJPEG AVI (与摄像头 MJPG 输出相同的逐帧 JPEG), 已存在时直接复用"""
+    output_dir = output_dir or os.path.join(tempfile.gettempdir(), "optical_flow_mjpeg")
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = os.path.join(output_dir, os.path.splitext(os.path.basename(video_path))[0] + ".avi")
+    if os.path.exists(output_path) and os.path.getmtime(output_path) >= os.path.getmtime(video_path):
+        return output_path
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*"MJPG"), fps, size)
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        writer.write(frame)
+    writer.release()
+    cap.release()
+    print(f"已重新编码为 MJPEG: {output_path}")
+    return output_path
+
+def decode_cost(mjpeg_path, scale=0.5):
+    """逐帧比较两种取帧方式的耗时 (ms)
+
+    bgr: 现有路径, VideoCapture 全分辨率解码为 BGR 后缩放、转灰度;
+    mjpeg_gray: 读取原始 JPEG 数据, 直接解码为 1/reduction 分辨率灰度 (余下缩放计入耗时)。
+    """
+    cap = cv2.VideoCapture(mjpeg_path)
+    bgr = []
+    while True:
+        t0 = time.perf_counter()
+        ret, frame = cap.read()
+        if not ret:
+            break
+        gray = cv2.cvtColor(cv2.resize(frame, (0, 0), fx=scale, fy=scale), cv2.COLOR_BGR2GRAY)
+        bgr.append(time.perf_counter() - t0)
+    cap.release()
+
+    cap, reduction = _open_video(mjpeg_path, True, scale)
+    reduced = []
+    while True:
+        t0 = time.perf_counter()
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if scale * reduction != 1:
+            frame = cv2.resize(frame, (0, 0), fx=scale * reduction, fy=scale * reduction)
+        reduced.append(time.perf_counter() - t0)
+    cap.release()
+    return {"reduction": reduction, "output_shape": gray.shape if bgr else None,
+            "bgr": _summarize(np.array(bgr) * 1000), "mjpeg_gray": _summarize(np.array(reduced) * 1000)}
+
+def print_decode_cost(video_path, cost):
+    bgr, gray = cost["bgr"], cost["mjpeg_gray"]
+    speedup = bgr["mean"] / gray["mean"] if gray["mean"] else float("nan")
+    print(f"{video_path}: 取帧到灰度图 {cost['output_shape']}, 全分辨率 BGR 解码 平均 {bgr['mean']:.2f} / "
+          f"p95 {bgr['p95']:.2f} ms -> 1/{cost['reduction']} 灰度解码 平均 {gray['mean']:.2f} / "
+          f"p95 {gray['p95']:.2f} ms (x{speedup:.2f})")
+
+def trace_agreement(baseline, result, tolerance=20):
+    """两条落点轨迹逐帧判定一致的比例, 以及落点 (原始分辨率) 相距不超过 tolerance 像素的比例"""
+    rows = {row["frame"]: row for row in result["trace"]}
+    total = max(len(baseline["trace"]), 1)
+    same_text = same_point = 0
+    for row in baseline["trace"]:
+        other = rows.get(row["frame"])
+        if other is None:
+            continue
+        same_text += other["text"] == row["text"]
+        if row["x"] is None or other["x"] is None:
+            same_point += row["x"] is None and other["x"] is None
+        else:
+            same_point += np.hypot(row["x"] - other["x"], row["y"] - other["y"]) <= tolerance
+    return same_text / total, same_point / total
+
+def tracking_error(measured, trace, window=5):
+    """平滑落点相对逐帧检测落点中值 (前后共 window 帧, 剔除单帧离群点) 的偏差 (原始分辨率像素)
+
+    偏差大说明平滑滞后于水柱移动或被离群点带偏。
+    """
+    errors = []
+    half = window // 2
+    for i, row in enumerate(trace):
+        nearby = [p for p in measured[max(0, i - half):i + half + 1] if p is not None]
+        if row["x"] is not None and nearby:
+            reference = np.median(nearby, axis=0)
+            errors.append(np.hypot(row["x"] - reference[0], row["y"] - reference[1]))
+    return _summarize(np.array(errors))
+
+def gate_recall(baseline, gated):
+    """运动门控相对常开模式的召回: (检出落点的帧, 输出的判定) 中门控模式也得到相同结果的比例"""
+    gated_rows = {row["frame"]: row for row in gated["trace"]}
+    detected = [row for row in baseline["trace"] if row["x"] is not None]
+    emitted = [row for row in baseline["trace"] if row["emit"]]
+    kept_points = sum(1 for row in detected if gated_rows[row["frame"]]["x"] is not None)
+    kept_emits = sum(1 for row in emitted
+                     if gated_rows[row["frame"]]["emit"] and gated_rows[row["frame"]]["text"] == row["text"])
+    return (kept_points / len(detected) if detected else 1.0,
+            kept_emits / len(emitted) if emitted else 1.0)
+
+def print_report(result):
+    """打印单个视频的帧率与各阶段耗时"""
+    detected = sum(1 for row in result["trace"] if row["x"] is not None)
+    print(f"{result['video']} [{result.get('flow_backend', 'dis_fast')}, {result.get('decode', 'bgr')}, "
+          f"{result.get('tracker', 'average')}]: {result['frames']} 帧, {result['seconds']:.2f} 秒, "
+          f"{result['fps']:.1f} FPS (仅检测 {result['detect_fps']:.1f} FPS), 检出落点 {detected} 帧"
+          + (f", 门控跳过 {result['skip_ratio']:.0%}" if result.get("skip_ratio") else ""))
+    print(f"  {'stage':<10}{'mean':>8}{'p50':>8}{'p95':>8}{'max':>8}  (ms)")
+    for name, s in result["stages_ms"].items():
+        print(f"  {name:<10}{s['mean']:>8.2f}{s['p50']:>8.2f}{s['p95']:>8.2f}{s['max']:>8.2f}")
+    if "tracking_error_px" in result:
+        e = result["tracking_error_px"]
+        print(f"  落点偏差 (相对 5 帧中值) 平均 {e['mean']:.1f} / p50 {e['p50']:.1f} / p95 {e['p95']:.1f} px")
+
+def write_results(results, output_path):
+    """按扩展名写出结果: .csv 只写落点轨迹, 其余写完整 JSON (含耗时)"""
+    if output_path.endswith(".csv"):
+        with open(output_path, "w", newline="", encoding="utf-8") as file:
+            writer = csv.DictWriter(file, fieldnames=TRACE_FIELDS)
+            writer.writeheader()
+            for result in results:
+                writer.writerows(result["trace"])
+    else:
+        with open(output_path, "w", encoding="utf-8") as file:
+            json.dump(results, file, ensure_ascii=False, indent=1)
+    print(f"结果已保存到 {output_path}")
+
+def _trace_key(row):
+    return row["x"], row["y"], row["text"]
+
+def compare_results(baseline, results):
+    """与之前保存的 JSON 结果对比速度和落点轨迹"""
+    old_by_video = {os.path.basename(r["video"]): r for r in baseline}
+    for result in results:
+        name = os.path.basename(result["video"])
+        old = old_by_video.get(name)
+        if old is None:
+            print(f"{name}: 基线中没有该视频")
+            continue
+        old_trace = {row["frame"]: _trace_key(row) for row in old["trace"]}
+        changed = sum(1 for row in result["trace"] if old_trace.get(row["frame"]) != _trace_key(row))
+        speedup = result["detect_fps"] / old["detect_fps"] if old["detect_fps"] else float("nan")
+        print(f"{name}: 检测速度 {old['detect_fps']:.1f} -> {result['detect_fps']:.1f} FPS (x{speedup:.2f}), "
+              f"落点/判定不同的帧 {changed}/{result['frames']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="离线评估水柱检测速度与落点轨迹")
+    parser.add_argument("videos", nargs="*", default=DEMO_VIDEOS, help="视频文件, 默认使用 demo 片段")
+    parser.add_argument("--scale", type=float, default=0.5)
+    parser.add_argument("--max-history", type=int, default=5)
+    parser.add_argument("--roi", action="store_true", help="只处理目标区域附近")
+    parser.add_argument("--roi-padding", type=int, default=120)
+    parser.add_argument("--motion-gate", action="store_true", help="启用运动门控, 并报告相对常开模式的召回")
+    parser.add_argument("--gate-threshold", type=int, default=12, help="门控帧差像素阈值")
+    parser.add_argument("--gate-hold", type=int, default=30, help="检测到运动后保持全速处理的帧数")
+    parser.add_argument("--flow-backend", default="dis_fast", choices=list(FLOW_BACKENDS) + ["auto"],
+                        help="光流后端; auto 时先在视频开头标定, 选达到 --target-fps 的最准确后端")
+    parser.add_argument("--target-fps", type=float, default=30)
+    parser.add_argument("--calibration-seconds", type=float, default=2.0)
+    parser.add_argument("--tracker", default="average", choices=TRACKERS,
+                        help="落点平滑方式; kalman 时同时跑一遍 average 对比落点偏差")
+    parser.add_argument("--mjpeg", action="store_true",
+                        help="把视频重新编码为 MJPEG, 比较逐帧解码耗时, 并以低分辨率灰度直接解码运行检测")
+    parser.add_argument("--mjpeg-dir", help="MJPEG 重新编码输出目录, 默认系统临时目录")
+    parser.add_argument("--output", help="结果输出路径 (.json 或 .csv)")
+    parser.add_argument("--compare", help="与之前 --output 保存的 JSON 结果对比")
+    args = parser.parse_args()
+
+    motion_gate = False
+    if args.motion_gate:
+        motion_gate = {"pixel_threshold": args.gate_threshold, "hold_frames": args.gate_hold}
+    results = []
+    for video_path in args.videos:
+        if args.mjpeg:
+            video_path = encode_mjpeg(video_path, args.mjpeg_dir)
+            print_decode_cost(video_path, decode_cost(video_path, args.scale))
+        flow_backend = args.flow_backend
+        if flow_backend == "auto":
+            frames = read_frames(video_path, max(2, int(args.calibration_seconds * 30)), args.mjpeg, args.scale)
+            params = DetectorParams(scale=args.scale, max_history=args.max_history, tracker=args.tracker)
+            flow_backend, report = calibrate_flow_backend(frames, args.target_fps, args.scale, args.roi, args.roi_padding,
+                                                          input_reduction=mjpeg_reduction(args.scale) if args.mjpeg else 1,
+                                                          params=params)
+            print_calibration(report, flow_backend, args.target_fps)
+        result = evaluate_video(video_path, args.scale, args.max_history, args.roi, args.roi_padding, motion_gate,
+                                flow_backend, args.mjpeg, args.tracker)
+        print_report(result)
+        if args.mjpeg:
+            baseline = evaluate_video(video_path, args.scale, args.max_history, args.roi, args.roi_padding, motion_gate,
+                                      flow_backend, tracker=args.tracker)
+            same_text, same_point = trace_agreement(baseline, result)
+            print(f"  BGR 解码 {baseline['fps']:.1f} FPS -> 灰度直接解码 {result['fps']:.1f} FPS, "
+                  f"判定一致 {same_text:.1%}, 落点一致 {same_point:.1%}")
+        if args.tracker != "average":
+            baseline = evaluate_video(video_path, args.scale, args.max_history, args.roi, args.roi_padding, motion_gate,
+                                      flow_backend, args.mjpeg)
+            same_text, _ = trace_agreement(baseline, result)
+            print(f"  average 落点偏差 平均 {baseline['tracking_error_px']['mean']:.1f} / p50 "
+                  f"{baseline['tracking_error_px']['p50']:.1f} px -> {args.tracker} 平均 "
+                  f"{result['tracking_error_px']['mean']:.1f} / p50 {result['tracking_error_px']['p50']:.1f} px, "
+                  f"跟踪耗时 {baseline['stages_ms']['classify']['mean'] * 1000:.0f} -> "
+                  f"{result['stages_ms']['classify']['mean'] * 1000:.0f} us, 判定一致 {same_text:.1%}")
+        if motion_gate:
+            baseline = evaluate_video(video_path, args.scale, args.max_history, args.roi, args.roi_padding,
+                                      flow_backend=flow_backend, tracker=args.tracker)
+            point_recall, emit_recall = gate_recall(baseline, result)
+            print(f"  常开模式 {baseline['detect_fps']:.1f} FPS -> 门控 {result['detect_fps']:.1f} FPS, "
+                  f"落点召回 {point_recall:.1%}, 判定召回 {emit_recall:.1%}")
+        results.append(result)
+    if args.output:
+        write_results(results, args.output)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as file:
+            compare_results(json.load(file), results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+import cv2
+import time
+import threading
+from collections import deque
+
+import numpy as np
+
+
+def open_capture(source=0, fps=30, width=1280, height=720):
+    """打开摄像头(整数索引)或视频文件(路径), 返回 VideoCapture"""
+    if isinstance(source, int):
+        cap = cv2.VideoCapture(source, cv2.CAP_V4L2)
+        # 设置 MJPG 格式（更适合高帧率）
+        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+        # 设置分辨率和帧率（根据摄像头支持）
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        cap.set(cv2.CAP_PROP_FPS, fps)
+    else:
+        cap = cv2.VideoCapture(source)
+    return cap
+
+
+# IMREAD_REDUCED_* 在 JPEG 解码时直接按 1/2、1/4、1/8 做 DCT 缩放, 不生成全分辨率图像
+MJPEG_DECODE_FLAGS = {
+    (1, False): cv2.IMREAD_GRAYSCALE,
+    (2, False): cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    (4, False): cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    (8, False): cv2.IMREAD_REDUCED_GRAYSCALE_8,
+    (1, True): cv2.IMREAD_COLOR,
+    (2, True): cv2.IMREAD_REDUCED_COLOR_2,
+    (4, True): cv2.IMREAD_REDUCED_COLOR_4,
+    (8, True): cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def mjpeg_reduction(scale):
+    """不低于 scale 的最小解码分辨率对应的缩小倍数 (1/2/4/8), 余下的缩放交给检测器"""
+    reduction = 1
+    while reduction < 8 and 1.0 / (reduction * 2) >= scale:
+        reduction *= 2
+    return reduction
+
+
+class MjpegCapture:
+    """读取原始 MJPEG 数据并直接解码为 1/reduction 分辨率的灰度图 (color=True 时为彩色, 仅供调试叠加显示)
+
+    跳过全分辨率 BGR 解码、缩放和颜色转换; 接口与 VideoCapture 的 read/grab/set/get/release 相同,
+    因此串行循环、采集线程和标定都无需区分。损坏的帧跳过并计入 decode_errors。
+    """
+
+    def __init__(self, cap, reduction=2, color=False):
+        self.cap = cap
+        self.reduction = reduction
+        self.color = color
+        self.flags = MJPEG_DECODE_FLAGS[(reduction, color)]
+        self.decode_errors = 0
+
+    def read(self, image=None):
+        while self.cap.grab():
+            ret, data = self.cap.retrieve()
+            decoded = cv2.imdecode(data, self.flags) if ret else None
+            if decoded is None:
+                self.decode_errors += 1
+                continue
+            if image is not None and image.shape == decoded.shape:
+                np.copyto(image, decoded)
+                return True, image
+            return True, decoded
+        return False, None
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def get(self, prop):
+        return self.cap.get(prop)
+
+    def set(self, prop, value):
+        return self.cap.set(prop, value)
+
+    def release(self):
+        self.cap.release()
+
+
+def open_mjpeg_capture(source=0, fps=30, reduction=2, color=False, width=1280, height=720):
+    """以原始 MJPEG 模式打开摄像头或视频文件, 返回 MjpegCapture
+
+    摄像头关闭 CAP_PROP_CONVERT_RGB 取得驱动给出的 JPEG 数据; 视频文件用 CAP_PROP_FORMAT=-1 只解封装。
+    视频文件不是 MJPEG 编码或后端不支持原始模式时返回 None, 由调用方回退到普通解码。
+    """
+    cap = open_capture(source, fps, width, height)
+    if not cap.isOpened():
+        return None
+    if isinstance(source, int):
+        raw = cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+    else:
+        fourcc = int(cap.get(cv2.CAP_PROP_FOURCC)).to_bytes(4, "little").decode("ascii", "replace")
+        raw = fourcc.upper() == "MJPG" and cap.set(cv2.CAP_PROP_FORMAT, -1)
+    if not raw:
+        cap.release()
+        return None
+    return MjpegCapture(cap, reduction, color)
+
+
+class FrameRing:
+    """固定容量的预分配帧环形缓冲区, 写满时丢弃最旧帧, 读取时总是取最新帧
+
+    cond 可传入多个缓冲区共用的 Condition (须基于可重入锁), 以便一个线程同时等待多路采集。
+    """
+
+    def __init__(self, shape, size=4, dtype=np.uint8, cond=None):
+        if size < 3:
+            raise ValueError("FrameRing 至少需要 3 个缓冲区 (写入/就绪/读取各一个)")
+        self._buffers = [np.empty(shape, dtype=dtype) for _ in range(size)]
+        self._stamps = [0.0] * size
+        self._seqs = [0] * size
+        self._free = deque(range(size))
+        self._ready = deque()
+        self._cond = cond or threading.Condition()
+        self._seq = 0
+        self.dropped = 0
+
+    def acquire_write(self):
+        """取一个可写缓冲区; 无空闲时回收最旧的就绪帧并计为丢帧"""
+        with self._cond:
+            if self._free:
+                idx = self._free.popleft()
+            else:
+                idx = self._ready.popleft()
+                self.dropped += 1
+        return idx, self._buffers[idx]
+
+    def commit(self, idx, stamp):
+        """将写好的缓冲区标记为就绪, stamp 为采集时间 (perf_counter)"""
+        with self._cond:
+            self._seq += 1
+            self._seqs[idx] = self._seq
+            self._stamps[idx] = stamp
+            self._ready.append(idx)
+            self._cond.notify()
+
+    def cancel(self, idx):
+        """放弃一次写入 (读取失败时), 缓冲区归还空闲队列"""
+        with self._cond:
+            self._free.append(idx)
+
+    def acquire_latest(self, timeout=None):
+        """等待并取出最新就绪帧, 更旧的就绪帧直接丢弃; 超时返回 None"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._ready, timeout=timeout):
+                return None
+            idx = self._ready.pop()
+            while self._ready:
+                self._free.append(self._ready.popleft())
+                self.dropped += 1
+            return idx, self._buffers[idx], self._stamps[idx], self._seqs[idx]
+
+    @property
+    def ready(self):
+        """已就绪未取走的帧数"""
+        return len(self._ready)
+
+    def release(self, idx):
+        """处理完成后归还缓冲区"""
+        with self._cond:
+            self._free.append(idx)
+
+
+class CaptureStats:
+    """采集/处理计数与采集到判定的端到端延迟统计"""
+
+    def __init__(self):
+        self.captured = 0
+        self.processed = 0
+        self.latency_count = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def record_latency(self, seconds):
+        self.latency_count += 1
+        self.latency_total += seconds
+        if seconds > self.latency_max:
+            self.latency_max = seconds
+
+    def summary(self, dropped):
+        avg = self.latency_total / self.latency_count if self.latency_count else 0.0
+        return (f"采集 {self.captured} 帧, 处理 {self.processed} 帧, 丢弃 {dropped} 帧, "
+                f"延迟 平均 {avg * 1000:.1f} ms / 最大 {self.latency_max * 1000:.1f} ms")
+
+
+class CaptureThread(threading.Thread):
+    """后台采集线程: 持续读取相机帧写入 FrameRing, 与光流处理解耦"""
+
+    def __init__(self, cap, ring, fps=30, loop_file=False):
+        super().__init__(daemon=True)
+        self.cap = cap
+        self.ring = ring
+        self.stats = CaptureStats()
+        # 视频文件没有硬件节拍, 按 fps 限速以模拟相机
+        self.frame_delay = 1.0 / fps if loop_file else 0.0
+        self.loop_file = loop_file
+        self._stop_event = threading.Event()
+
+    def run(self):
+        """采集循环; 读取出错 (例如分辨率变化后无法拷回缓冲区) 时打印原因并结束, running 随之变为 False"""
+        try:
+            while not self._stop_event.is_set():
+                start_time = time.perf_counter()
+                idx, buf = self.ring.acquire_write()
+                try:
+                    ret, frame = self.cap.read(buf)
+                    if ret and frame is not buf:
+                        # 分辨率变化等情况下 OpenCV 会重新分配, 拷回预分配缓冲区
+                        np.copyto(buf, frame)
+                except BaseException:
+                    self.ring.cancel(idx)
+                    raise
+                if not ret:
+                    self.ring.cancel(idx)
+                    if self.loop_file:
+                        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                        continue
+                    break
+                self.ring.commit(idx, time.perf_counter())
+                self.stats.captured += 1
+                if self.frame_delay:
+                    remaining = self.frame_delay - (time.perf_counter() - start_time)
+                    if remaining > 0:
+                        time.sleep(remaining)
+        except Exception as e:
+            print(f"采集线程异常退出: {e!r}")
+        finally:
+            self._stop_event.set()
+
+    @property
+    def running(self):
+        return not self._stop_event.is_set()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join(timeout=1.0)
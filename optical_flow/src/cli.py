@@ -0,0 +1,191 @@
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+CAMERA_DIR = os.path.join(os.path.dirname(SRC_DIR), "camera")
+
+# 各子命令实际需要导入的模块; startup 子命令据此测量导入耗时
+MODE_IMPORTS = {
+    "detect": ["preprocess"],
+    "speak": ["main"],
+    "asr": ["asr"],
+    "bench": ["bench"],
+    "multi": ["multicam"],
+}
+# 重构前导入 llm.py / asr.py 时会被一并加载的重量级依赖, 用于对比
+EAGER_IMPORTS = {
+    "detect": [],
+    "speak": ["openai", "PIL.Image", "readline"],
+    "asr": ["whisper"],
+    "bench": [],
+    "multi": [],
+}
+
+
+def _parse_source(source):
+    """数字视为摄像头索引, 其余视为视频文件路径"""
+    return int(source) if source.isdigit() else source
+
+def _configure_metrics(args):
+    if args.metrics_port or args.metrics_json:
+        import metrics
+        metrics.configure(args.metrics_port, args.metrics_json)
+
+def cmd_detect(args):
+    from preprocess import detect_water_jet_fast_loop
+    _configure_metrics(args)
+    detector = detect_water_jet_fast_loop(
+        _parse_source(args.source), scale=args.scale, threaded=not args.serial, roi=args.roi,
+        debug=args.debug, motion_gate=args.motion_gate, flow_backend=args.flow_backend, config_path=args.config,
+        mjpeg_gray=args.mjpeg_gray, recorder={"directory": args.record_dir} if args.record_dir else None)
+    try:
+        for text in detector:
+            print(text)
+    except KeyboardInterrupt:
+        pass
+
+def cmd_speak(args):
+    from main import main
+    main(_parse_source(args.source))
+
+def cmd_asr(args):
+    sys.path.insert(0, CAMERA_DIR)
+    if args.mic is not None:
+        import asr
+        import record
+        worker = asr.ASRWorker(args.model, args.threads).start()
+        record.stream_segments(args.mic, on_segment=worker.submit_segment)
+        worker.close()
+        print(worker.summary())
+    else:
+        from asr import transcribe_wav_streaming
+        transcribe_wav_streaming(args.wav, args.model, args.threads)
+
+def cmd_bench(args):
+    import bench
+    sys.argv = ["bench.py"] + args.bench_args
+    bench.main()
+
+def cmd_multi(args):
+    import multicam
+    _configure_metrics(args)
+    sys.argv = ["multicam.py"] + args.multi_args
+    multicam.main()
+
+
+def _import_entries(stderr):
+    """解析 -X importtime 的输出, 返回 [(模块自身导入耗时秒数, 模块名)], 包含各层嵌套导入"""
+    entries = []
+    for line in stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3:
+            try:
+                entries.append((int(parts[0].rsplit(":", 1)[-1]) / 1e6, parts[2].strip()))
+            except ValueError:
+                continue
+    return entries
+
+def _time_import(modules, repeat):
+    """在子进程中导入 modules, 返回 (扣除解释器启动后的最短耗时秒数, 最重的依赖包, 错误信息)
+
+    最重的依赖包按顶层包名汇总各模块 (含嵌套导入) 的自身耗时, 排除解释器启动时就会导入的模块,
+    因此显示的是 cv2 / numpy / openai / requests 这类真正拖慢启动的依赖。
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([SRC_DIR, CAMERA_DIR, os.environ.get("PYTHONPATH", "")]))
+    statement = "; ".join(f"import {m}" for m in modules) or "pass"
+
+    def run(code, importtime=False):
+        command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+        start_time = time.perf_counter()
+        result = subprocess.run(command, env=env, cwd=os.path.dirname(SRC_DIR), capture_output=True, text=True)
+        return time.perf_counter() - start_time, result
+
+    baseline = min(run("pass")[0] for _ in range(repeat))
+    samples = []
+    for _ in range(repeat):
+        seconds, result = run(statement)
+        if result.returncode != 0:
+            return None, [], result.stderr.strip().splitlines()[-1]
+        samples.append(seconds)
+    startup = {name for _, name in _import_entries(run("pass", importtime=True)[1].stderr)}
+    packages = {}
+    for seconds, name in _import_entries(run(statement, importtime=True)[1].stderr):
+        if name not in startup:
+            package = name.split(".")[0]
+            packages[package] = packages.get(package, 0.0) + seconds
+    heaviest = sorted(((seconds, package) for package, seconds in packages.items()), reverse=True)
+    return max(0.0, min(samples) - baseline), heaviest[:3], None
+
+def cmd_startup(args):
+    """报告每个子命令的导入耗时, 并与重构前会被一并导入的依赖对比"""
+    unknown = set(args.modes) - set(MODE_IMPORTS)
+    if unknown:
+        raise SystemExit(f"未知的子命令: {', '.join(sorted(unknown))}")
+    print(f"{'mode':<8}{'lazy':>10}{'eager':>10}  heaviest imports")
+    for mode in args.modes or list(MODE_IMPORTS):
+        lazy, heaviest, error = _time_import(MODE_IMPORTS[mode], args.repeat)
+        if error:
+            print(f"{mode:<8}{'-':>10}{'-':>10}  {error}")
+            continue
+        eager_modules = MODE_IMPORTS[mode] + EAGER_IMPORTS[mode]
+        eager, _, eager_error = _time_import(eager_modules, args.repeat) if EAGER_IMPORTS[mode] else (lazy, [], None)
+        eager_text = f"{eager * 1000:>8.0f}ms" if eager_error is None else f"{'n/a':>10}"
+        top = ", ".join(f"{name} {seconds * 1000:.0f}ms" for seconds, name in heaviest)
+        print(f"{mode:<8}{lazy * 1000:>8.0f}ms{eager_text}  {top}")
+        if eager_error:
+            print(f"{'':<8}eager 依赖无法导入: {eager_error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="水柱检测 / 多路检测 / 评论播报 / 语音识别 / 离线评估 命令行入口, 每个子命令只导入所需模块")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    detect = subparsers.add_parser("detect", help="只运行水柱检测, 打印判定")
+    detect.add_argument("source", nargs="?", default="0", help="摄像头索引或视频文件")
+    detect.add_argument("--scale", type=float, default=0.5)
+    detect.add_argument("--roi", action="store_true")
+    detect.add_argument("--serial", action="store_true", help="不使用后台采集线程")
+    detect.add_argument("--debug", action="store_true", help="显示检测窗口")
+    detect.add_argument("--motion-gate", action="store_true")
+    detect.add_argument("--flow-backend", default="dis_fast")
+    detect.add_argument("--config", help="含 detector 段的 YAML, 修改后自动重载")
+    detect.add_argument("--mjpeg-gray", action="store_true", help="原始 MJPEG 直接解码为低分辨率灰度图")
+    detect.add_argument("--record-dir", help="输出判定时把前后几秒画面录像到该目录")
+    detect.add_argument("--metrics-port", type=int, help="在本机该端口提供 /metrics (Prometheus) 和 /metrics.json")
+    detect.add_argument("--metrics-json", help="退出时把指标写入该 JSON 文件")
+    detect.set_defaults(func=cmd_detect)
+
+    speak = subparsers.add_parser("speak", help="检测 + Kimi 评论 + MiniMax TTS + 播放 (同 main.py)")
+    speak.add_argument("source", nargs="?", default="./demo/normal.mp4")
+    speak.set_defaults(func=cmd_speak)
+
+    asr = subparsers.add_parser("asr", help="Whisper 语音识别 (WAV 文件或麦克风)")
+    asr.add_argument("wav", nargs="?", default="ds_e12_output.wav")
+    asr.add_argument("--mic", type=int, help="麦克风设备索引, 指定时连续采集")
+    asr.add_argument("--model", default="base")
+    asr.add_argument("--threads", type=int, default=None)
+    asr.set_defaults(func=cmd_asr)
+
+    bench = subparsers.add_parser("bench", help="离线评估 (参数同 bench.py)")
+    bench.add_argument("bench_args", nargs=argparse.REMAINDER)
+    bench.set_defaults(func=cmd_bench)
+
+    multi = subparsers.add_parser("multi", help="多路相机共用线程池检测 (参数同 multicam.py)")
+    multi.add_argument("--metrics-port", type=int, help="在本机该端口提供 /metrics (各路带 camera 标签)")
+    multi.add_argument("--metrics-json", help="退出时把指标写入该 JSON 文件")
+    multi.add_argument("multi_args", nargs=argparse.REMAINDER)
+    multi.set_defaults(func=cmd_multi)
+
+    startup = subparsers.add_parser("startup", help="测量各子命令的导入耗时")
+    startup.add_argument("modes", nargs="*", help=f"默认测量全部子命令: {' '.join(MODE_IMPORTS)}")
+    startup.add_argument("--repeat", type=int, default=3)
+    startup.set_defaults(func=cmd_startup)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
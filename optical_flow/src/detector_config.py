@@ -0,0 +1,140 @@
+import os
+import time
+import threading
+
+import yaml
+
+from tracker import TRACKERS
+
+# 检测器参数默认值, 与 config.yaml 的 detector 段一一对应
+DETECTOR_DEFAULTS = {
+    "region": (465, 242, 119, 215),  # 目标区域 (原始分辨率 x, y, w, h)
+    "center_ratio": 0.05,            # 正中央小框占画面宽高的比例
+    "edge_ratio": 0.1,               # "差点出去" 边缘带占目标区域宽高的比例
+    "scale": 0.5,
+    "max_history": 5,
+    "motion_threshold": 25,          # 归一化 (0-255) 光流幅值取整后大于该值视为运动
+    "canny_low": 50,
+    "canny_high": 150,
+    "jet_percentile": 95,            # 幅值高于正值的该百分位视为水柱
+    "min_jet_pixels": 50,            # 水柱像素超过该数量才输出落点
+    "emit_interval": 30,             # 每隔多少帧输出一次判定
+    "tracker": "average",            # 落点平滑: average (最近 max_history 帧平均) 或 kalman (匀速卡尔曼滤波)
+    "kalman_process_noise": 1.0,     # 卡尔曼过程噪声, 越大越跟手
+    "kalman_measurement_noise": 4.0, # 卡尔曼观测噪声, 越大越平滑
+    "tracker_jump": 100,             # 落点偏离预测超过该距离 (原始分辨率像素) 时直接跳到新位置
+}
+
+
+class DetectorParams:
+    """检测器可调参数; 构造时校验, 非法值抛出 ValueError"""
+
+    def __init__(self, **overrides):
+        unknown = set(overrides) - set(DETECTOR_DEFAULTS)
+        if unknown:
+            raise ValueError(f"未知的检测器参数: {', '.join(sorted(unknown))}")
+        values = dict(DETECTOR_DEFAULTS, **{k: v for k, v in overrides.items() if v is not None})
+        self.region = tuple(int(v) for v in values["region"])
+        self.center_ratio = float(values["center_ratio"])
+        self.edge_ratio = float(values["edge_ratio"])
+        self.scale = float(values["scale"])
+        self.max_history = int(values["max_history"])
+        self.motion_threshold = int(values["motion_threshold"])
+        self.canny_low = int(values["canny_low"])
+        self.canny_high = int(values["canny_high"])
+        self.jet_percentile = float(values["jet_percentile"])
+        self.min_jet_pixels = int(values["min_jet_pixels"])
+        self.emit_interval = int(values["emit_interval"])
+        self.tracker = str(values["tracker"])
+        self.kalman_process_noise = float(values["kalman_process_noise"])
+        self.kalman_measurement_noise = float(values["kalman_measurement_noise"])
+        self.tracker_jump = float(values["tracker_jump"])
+        if len(self.region) != 4 or self.region[2] <= 0 or self.region[3] <= 0:
+            raise ValueError(f"region 应为正尺寸的 [x, y, w, h]: {values['region']}")
+        if not 0 < self.scale <= 1:
+            raise ValueError(f"scale 应在 (0, 1] 之间: {self.scale}")
+        if not 0 <= self.jet_percentile <= 100:
+            raise ValueError(f"jet_percentile 应在 0-100 之间: {self.jet_percentile}")
+        if self.canny_low > self.canny_high:
+            raise ValueError("canny_low 不能大于 canny_high")
+        if self.max_history < 1 or self.emit_interval < 1:
+            raise ValueError("max_history 和 emit_interval 至少为 1")
+        if self.tracker not in TRACKERS:
+            raise ValueError(f"tracker 应为 {' / '.join(TRACKERS)}: {self.tracker}")
+        if self.kalman_process_noise <= 0 or self.kalman_measurement_noise <= 0 or self.tracker_jump <= 0:
+            raise ValueError("卡尔曼噪声和 tracker_jump 应为正数")
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(**(config.get("detector") or {}))
+
+    def as_dict(self):
+        return {key: getattr(self, key) for key in DETECTOR_DEFAULTS}
+
+    def __eq__(self, other):
+        return isinstance(other, DetectorParams) and self.as_dict() == other.as_dict()
+
+    def __repr__(self):
+        return f"DetectorParams({self.as_dict()})"
+
+
+def load_detector_params(config_path):
+    with open(config_path, "r", encoding="utf-8") as file:
+        return DetectorParams.from_config(yaml.safe_load(file) or {})
+
+
+class ConfigWatcher:
+    """后台轮询配置文件修改时间, 变化时用 loader 重新解析 (默认只解析 detector 段)
+
+    解析和校验都在后台线程完成; 检测循环在帧与帧之间调用 poll() 取走新参数 (没有变化时返回 None),
+    因此参数切换不会发生在一帧处理的中途。文件解析失败或参数非法时打印错误并保留旧参数。
+    """
+
+    def __init__(self, config_path, interval=1.0, loader=load_detector_params):
+        self.config_path = config_path
+        self.interval = interval
+        self.loader = loader
+        self.reloads = 0
+        self._mtime = self._stat()
+        self._pending = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _stat(self):
+        try:
+            return os.stat(self.config_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            mtime = self._stat()
+            if mtime is None or mtime == self._mtime:
+                continue
+            self._mtime = mtime
+            try:
+                params = self.loader(self.config_path)
+            except (OSError, yaml.YAMLError, ValueError, TypeError) as e:
+                print(f"检测器配置重载失败, 保留原参数: {e}")
+                continue
+            with self._lock:
+                self._pending = params
+            self.reloads += 1
+            summary = params.as_dict() if isinstance(params, DetectorParams) else params
+            print(f"检测器配置已更新 ({time.strftime('%H:%M:%S')}): {summary}")
+
+    def poll(self):
+        """取走最新一次重载的参数, 没有新参数时返回 None"""
+        if self._pending is None:
+            return None
+        with self._lock:
+            params, self._pending = self._pending, None
+        return params
@@ -2,14 +2,21 @@ import os
 import time
 import json
 import yaml
+import queue
 import random
 import requests
-import readline
+import threading
 import subprocess
-from PIL import Image
-from openai import OpenAI
-from typing import Iterator
+from typing import TYPE_CHECKING, Iterator
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+import metrics
+# from PIL import Image
 # from accelerate import Accelerator
 # from transformers import Qwen2VLForConditionalGeneration, AutoProcessor
 
@@ -17,54 +24,217 @@ CONFIG = "./config/config_customize.yaml"
 OUTPUT_FILE = "./audio/output.mp3"
 IMITATE_AUDIO = "./audio/demo/imitate_audio.mp3"
 
-load_dotenv(dotenv_path="./config/.env")
-kimi_api_key = os.getenv("kimi")
-mini_api_key = os.getenv("mini")
-group_id = os.getenv('group_id')
-if not all([kimi_api_key, mini_api_key, group_id]):
-    raise ValueError("Missing required environment variables: kimi, mini, or group_id")
+file_format = "mp3"
+kimi_base_url = "https://api.moonshot.cn/v1"
+minimax_base_url = "https://api.minimaxi.com"
 
+# --- Metrics ---
+KIMI_FIRST_TOKEN = metrics.histogram("llm_first_token_seconds", "Kimi 请求到首个 token 的时间")
+KIMI_RESPONSE = metrics.histogram("llm_response_seconds", "Kimi 流式响应总耗时")
+TTS_RESPONSE = metrics.histogram("tts_response_seconds", "MiniMax TTS 请求到响应头的时间")
+TTS_FIRST_AUDIO = metrics.histogram("tts_first_audio_seconds", "MiniMax TTS 请求到首个音频块的时间")
+SPEECH_FIRST_AUDIO = metrics.histogram("speech_first_audio_seconds", "边生成边合成时, Kimi 请求到首个音频块的时间")
+API_ERRORS = {api: metrics.counter("api_errors_total", "Kimi / MiniMax 请求失败次数", {"api": api})
+              for api in ("kimi", "minimax")}
 
-file_format = "mp3"
-url = f"https://api.minimaxi.com/v1/t2a_v2?GroupId={group_id}"
-headers = {
-    "Content-Type": "application/json",
-    "Authorization": f"Bearer {mini_api_key}"
-}
+# --- Credentials and configuration, loaded on first use ---
+# 导入本模块不读取 .env / YAML, 只检测或离线评估时不需要 API key
+_credentials = None
+_config = None
+
+def credentials() -> dict:
+    """读取 config/.env 中的 kimi、mini、group_id, 缺失时抛出 ValueError"""
+    global _credentials
+    if _credentials is None:
+        load_dotenv(dotenv_path="./config/.env")
+        values = {"kimi": os.getenv("kimi"), "mini": os.getenv("mini"), "group_id": os.getenv("group_id")}
+        if not all(values.values()):
+            raise ValueError("Missing required environment variables: kimi, mini, or group_id")
+        _credentials = values
+    return _credentials
+
+def minimax_tts_url() -> str:
+    return f"{minimax_base_url}/v1/t2a_v2?GroupId={credentials()['group_id']}"
+
+def api_headers() -> dict:
+    return {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {credentials()['mini']}"
+    }
 
 # --- Load configuration from YAML file ---
 def load_config():
     with open(CONFIG, 'r', encoding='utf-8') as file:
         return yaml.safe_load(file)
-config = load_config()
-     
+
+def get_config() -> dict:
+    """返回缓存的配置, 首次调用时读取 CONFIG"""
+    global _config
+    if _config is None:
+        _config = load_config()
+    return _config
+
+# --- Long-lived HTTP clients ---
+_kimi_client = None
+_tts_session = None
+
+def http_settings() -> dict:
+    """读取 config 中的 http_settings, 缺省项使用默认值"""
+    settings = {
+        "connect_timeout": 3.05,
+        "read_timeout": 30,
+        "retries": 2,
+        "backoff_factor": 0.3,
+        "pool_size": 4,
+    }
+    settings.update(get_config().get("http_settings") or {})
+    return settings
+
+def get_kimi_client() -> "OpenAI":
+    """返回复用的 Kimi 客户端 (内部 httpx 连接池保持 keep-alive)"""
+    global _kimi_client
+    if _kimi_client is None:
+        from openai import OpenAI  # openai 导入较慢, 只在首次调用 Kimi 时加载
+        settings = http_settings()
+        _kimi_client = OpenAI(
+            api_key=credentials()["kimi"],
+            base_url=kimi_base_url,
+            timeout=settings["read_timeout"],
+            max_retries=settings["retries"],
+        )
+    return _kimi_client
+
+def get_tts_session() -> requests.Session:
+    """返回复用的 MiniMax 会话: 连接池 + 连接失败/5xx 时指数退避重试"""
+    global _tts_session
+    if _tts_session is None:
+        settings = http_settings()
+        retry = Retry(
+            total=settings["retries"],
+            backoff_factor=settings["backoff_factor"],
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(["GET", "HEAD", "POST"]),
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings["pool_size"], max_retries=retry)
+        _tts_session = requests.Session()
+        _tts_session.mount("https://", adapter)
+        _tts_session.mount("http://", adapter)
+    return _tts_session
+
+def request_timeout() -> tuple:
+    settings = http_settings()
+    return settings["connect_timeout"], settings["read_timeout"]
+
+def warm_up():
+    """启动时预先建立到 Kimi 和 MiniMax 的 TLS 连接, 首条评论不再承担握手开销"""
+    start_time = time.time()
+    try:
+        get_kimi_client().models.list()
+        print(f"Kimi warm-up (connect) time: {time.time() - start_time:.2f} seconds")
+    except Exception as e:
+        print(f"Kimi warm-up failed: {e}")
+    start_time = time.time()
+    try:
+        get_tts_session().head(minimax_base_url, timeout=request_timeout())
+        print(f"MiniMax warm-up (connect) time: {time.time() - start_time:.2f} seconds")
+    except requests.RequestException as e:
+        print(f"MiniMax warm-up failed: {e}")
+
 # --- Kimi VLM/LLM ---
-def get_kimi_response(text="水柱落在区域中间") -> str:
+def stream_kimi_response(text="水柱落在区域中间") -> Iterator[str]:
+    """流式调用 Kimi, 文本片段一到达就 yield"""
     start_time = time.time()
-    client = OpenAI(
-        api_key=kimi_api_key,
-        base_url = "https://api.moonshot.cn/v1"
-    )
+    client = get_kimi_client()
     data = [
         {"role": "system", "content": "你是一个幽默风趣的助手, \
           根据水柱落点生成20字以内的中文俏皮评论, 风格类似“你射的好歪啊, 行不行啊老铁”。开头需要有如“唉~咱就是说”“于谦你瞅瞅”等郭德纲的语气词"},
         {"role": "user", "content": text}
     ]
-    response = client.chat.completions.create(
-        # model="kimi-k2-0711-preview",
-        model="moonshot-v1-8k",
-        messages=data,
-        temperature=0.6,
-        stream=True
-    )
-    content = ""
+    try:
+        response = client.chat.completions.create(
+            # model="kimi-k2-0711-preview",
+            model="moonshot-v1-8k",
+            messages=data,
+            temperature=0.6,
+            stream=True
+        )
+    except Exception:
+        API_ERRORS["kimi"].inc()
+        raise
+    header_time = time.time() - start_time
+    first_token_time = None
     for chunk in response:
         if chunk.choices[0].delta.content:
-            content += chunk.choices[0].delta.content
+            if first_token_time is None:
+                first_token_time = time.time() - start_time
+                KIMI_FIRST_TOKEN.observe(first_token_time)
+            yield chunk.choices[0].delta.content
     kimi_time = time.time() - start_time
-    print(f"Kimi response time: {kimi_time:.2f} seconds")
+    KIMI_RESPONSE.observe(kimi_time)
+    print(f"Kimi response time: {kimi_time:.2f} seconds "
+          f"(request/connect {header_time:.2f}s, first token {first_token_time or 0:.2f}s)")
+
+def get_kimi_response(text="水柱落在区域中间") -> str:
+    return "".join(stream_kimi_response(text))
+
+SENTENCE_END = "。！？!?…\n"
+CLAUSE_END = "，,；;、~～"
+
+def split_sentences(fragments: Iterator[str], min_chars: int = 6) -> Iterator[str]:
+    """把流式文本片段按中文标点切成句子; 逗号等处只有攒够 min_chars 个字才切分"""
+    buffer = ""
+    for fragment in fragments:
+        for char in fragment:
+            buffer += char
+            if char in SENTENCE_END or (char in CLAUSE_END and len(buffer) >= min_chars):
+                if buffer.strip():
+                    yield buffer
+                buffer = ""
+    if buffer.strip():
+        yield buffer
+
+def observe_first(items: Iterator, histogram, start_time: float) -> Iterator:
+    """原样转发迭代器, 第一项到达时把距 start_time 的耗时记入 histogram"""
+    first = True
+    for item in items:
+        if first:
+            first = False
+            histogram.observe(time.time() - start_time)
+        yield item
 
-    return content
+def speak_streaming(text: str, voice: tuple = None, sink=None, archive: bool = True) -> tuple:
+    """Kimi 边生成边按句送入 MiniMax TTS, 首句音频在 LLM 结束前即可播放
+
+    后台线程消费 Kimi 流并切句, 当前线程依次合成每句; 返回 (完整评论, 音频)。
+    """
+    sentences = queue.Queue()
+    errors = []
+
+    def produce():
+        try:
+            for sentence in split_sentences(stream_kimi_response(text)):
+                sentences.put(sentence)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            sentences.put(None)
+
+    start_time = time.time()
+    threading.Thread(target=produce, daemon=True).start()
+    content = ""
+    audio = bytearray()
+    while True:
+        sentence = sentences.get()
+        if sentence is None:
+            break
+        chunks = call_tts_stream(sentence, voice)
+        if not content:
+            chunks = observe_first(chunks, SPEECH_FIRST_AUDIO, start_time)
+        content += sentence
+        audio += audio_play(chunks, sink=sink, archive=archive)
+    if errors:
+        raise errors[0]
+    return content, audio
 
 # def get_qwen_response(image_path: str) -> str:
 #     start_time = time.time()
@@ -100,12 +270,13 @@ def build_tts_stream_headers() -> dict:
     headers = {
         'accept': 'application/json, text/plain, */*',
         'content-type': 'application/json',
-        'authorization': f'Bearer {mini_api_key}',
+        'authorization': f'Bearer {credentials()["mini"]}',
     }
     return headers
 
-def build_tts_stream_body(text: str) -> dict:
-    """构建TTS请求体"""
+def select_voice() -> tuple:
+    """按配置选择音色, 返回 (voice_id, voice_params); tts_change 为真时随机选择"""
+    config = get_config()
     if not config["tts_change"]:
         voices = config["tts_settings"]["default"]
         voice_id = list(voices.keys())[0]
@@ -114,6 +285,11 @@ def build_tts_stream_body(text: str) -> dict:
         voices = config["tts_settings"]["voices"]
         voice_id = random.choice(list(voices.keys()))
         voice_params = voices.get(voice_id, voices['male-qn-qingse'])
+    return voice_id, voice_params
+
+def build_tts_stream_body(text: str, voice: tuple = None) -> dict:
+    """构建TTS请求体, voice 为 select_voice() 的结果, 为空时按配置选择"""
+    voice_id, voice_params = voice or select_voice()
     print(voice_id, voice_params)
     body = json.dumps({
         "model": "speech-02-turbo",
@@ -133,64 +309,118 @@ def build_tts_stream_body(text: str) -> dict:
             "pitch":0,
             "emotion":voice_params["emotion"],
         },
-        "pronunciation_dict":config["tts_settings"]["pronunciation_dict"],
-        "audio_setting":config["tts_settings"]["audio_setting"]
+        "pronunciation_dict":get_config()["tts_settings"]["pronunciation_dict"],
+        "audio_setting":get_config()["tts_settings"]["audio_setting"]
     })
     return body
 
-def call_tts_stream(text: str) -> Iterator[bytes]:
+def call_tts_stream(text: str, voice: tuple = None) -> Iterator[bytes]:
     """调用TTS流式API"""
     start_time = time.time()
-    tts_url = url
+    tts_url = minimax_tts_url()
     tts_headers = build_tts_stream_headers()
-    tts_body = build_tts_stream_body(text)
-    response = requests.post(tts_url,  stream=True, headers=headers, data=tts_body)
+    tts_body = build_tts_stream_body(text, voice)
+    try:
+        response = get_tts_session().post(tts_url, stream=True, headers=api_headers(), data=tts_body,
+                                          timeout=request_timeout())
+    except requests.RequestException:
+        API_ERRORS["minimax"].inc()
+        raise
     minimax_time = time.time() - start_time
-    print(f"MiniMax TTS response time: {minimax_time:.2f} seconds")
-    
-    for chunk in (response.raw):
-        if chunk:
-            if chunk[:5] == b'data:':
-                data = json.loads(chunk[5:])
-                if "data" in data and "extra_info" not in data:
-                    if "audio" in data["data"]:
-                        audio = data["data"]['audio']
-                        yield audio
-
-def audio_play(audio_stream: Iterator[bytes]) -> bytes:
-    # mpv_command = ["mpv", "--no-cache", "--no-terminal", "--", "fd://0"]
-    # mpv_process = subprocess.Popen(
-        # mpv_command,
-        # stdin=subprocess.PIPE,
-        # stdout=subprocess.DEVNULL,
-        # stderr=subprocess.DEVNULL,
-    # )
-    audio = b""
+    TTS_RESPONSE.observe(minimax_time)
+    print(f"MiniMax TTS response time: {minimax_time:.2f} seconds "
+          f"(request/connect {response.elapsed.total_seconds():.2f}s)")
+
+    first_chunk = True
     try:
-        for chunk in audio_stream:
-            if chunk is not None and chunk != '\n':
-                decoded_hex = bytes.fromhex(chunk)
-                # mpv_process.stdin.write(decoded_hex)  # type: ignore
-                # mpv_process.stdin.flush()
-                
-                audio += decoded_hex
-        # with open(file=OUTPUT_FILE, mode='wb') as f:
-        #     f.write(audio)
+        # 读完整个响应体后连接才会归还连接池, 供下一次请求复用
+        for chunk in response.iter_lines():
+            if chunk:
+                if chunk[:5] == b'data:':
+                    data = json.loads(chunk[5:])
+                    if "data" in data and "extra_info" not in data:
+                        if "audio" in data["data"]:
+                            audio = data["data"]['audio']
+                            if first_chunk:
+                                first_chunk = False
+                                first_audio_time = time.time() - start_time
+                                TTS_FIRST_AUDIO.observe(first_audio_time)
+                                print(f"MiniMax TTS first audio chunk: {first_audio_time:.2f} seconds")
+                            yield audio
     finally:
-        pass
-        # mpv_process.stdin.close()
-        # mpv_process.wait()  
+        response.close()
+
+MPV_STREAM_COMMAND = ["mpv", "--no-cache", "--no-terminal", "--", "fd://0"]
+
+class MpvSink:
+    """常驻 mpv 播放进程, 从 stdin 接收 mp3 数据边收边播
+
+    多段语音依次写入同一个进程, 省去每句话启动 mpv 的开销; 进程意外退出时下次写入自动重启。
+    多个线程共用时, 写入一段语音期间持有 lock (可重入), 避免两段 mp3 数据在 stdin 上交错。
+    """
+
+    def __init__(self, command=MPV_STREAM_COMMAND):
+        self.command = command
+        self.process = None
+        self.lock = threading.RLock()
+
+    def start(self):
+        if self.process is None or self.process.poll() is not None:
+            self.process = subprocess.Popen(
+                self.command,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+        return self
+
+    def write(self, data: bytes):
+        with self.lock:
+            try:
+                self.start().process.stdin.write(data)
+                self.process.stdin.flush()
+            except BrokenPipeError:
+                # mpv 已退出, 丢弃当前进程, 下一块数据会重新拉起播放器
+                self.process = None
+
+    def close(self):
+        if self.process is not None:
+            try:
+                self.process.stdin.close()
+            except BrokenPipeError:
+                pass
+            self.process.wait()
+            self.process = None
+
+def audio_play(audio_stream: Iterator[bytes], sink: MpvSink = None, archive: bool = True) -> bytearray:
+    """解码 TTS 流式返回的 hex 音频块; 传入 sink 时每块到达即送去播放
+
+    archive=True 时把音频累积到 bytearray 中返回 (用于保存文件), 否则只播放不保存。
+    """
+    start_time = time.time()
+    first_chunk_time = None
+    audio = bytearray()
+    for chunk in audio_stream:
+        if chunk is not None and chunk != '\n':
+            decoded_hex = bytes.fromhex(chunk)
+            if first_chunk_time is None:
+                first_chunk_time = time.time() - start_time
+                print(f"Time to first audio chunk: {first_chunk_time:.2f} seconds")
+            if sink is not None:
+                sink.write(decoded_hex)
+            if archive:
+                audio += decoded_hex
     return audio
 
 def upload_audio(audio_path: str) -> str:
     # 复刻郭德纲音频上传
     headers_up = {
         "authority": "api.minimaxi.com",
-        "Authorization": f"Bearer {mini_api_key}"
+        "Authorization": f"Bearer {credentials()['mini']}"
     }
     data = {"purpose":"voice_clone"}
     files = {"file": open(audio_path, "rb")}
-    response = requests.post(url=url, headers=headers_up, data=data, files=files)
+    response = requests.post(url=minimax_tts_url(), headers=headers_up, data=data, files=files)
     if response.status_code != 200:
         raise RuntimeError(f"上传失败: {response.status_code} - {response.text}")
     json_response = response.json()
@@ -201,7 +431,7 @@ def upload_audio(audio_path: str) -> str:
 
 
 if __name__ == "__main__":
-    text_gen = config["model_settings"]["qwen"]
+    text_gen = get_config()["model_settings"]["qwen"]
     if not text_gen:
         text = get_kimi_response()
     # else:
@@ -211,7 +441,9 @@ if __name__ == "__main__":
     # Call MiniMax TTS with the text from Kimi
     audio_chunk_iterator = call_tts_stream(text)
     if audio_chunk_iterator:
-        audio = audio_play(audio_chunk_iterator)
+        sink = MpvSink()
+        audio = audio_play(audio_chunk_iterator, sink=sink)
+        sink.close()
         timestamp = int(time.time())
         file_name = f"./audio/{OUTPUT_FILE.split('.')[0]}_{timestamp}.{file_format}"
         with open(file_name, 'wb') as file:
@@ -0,0 +1,316 @@
+import os
+import time
+import queue
+import argparse
+import threading
+
+import cv2
+import yaml
+
+from capture import CaptureThread, FrameRing, open_capture
+from detector_config import ConfigWatcher, DetectorParams
+from preprocess import VERDICT_LABELS, DetectorMetrics, JetDetector
+from recorder import ClipRecorder, recorder_settings
+
+
+def _parse_source(source):
+    """数字 (或数字字符串) 视为摄像头索引, 其余视为视频文件路径"""
+    if isinstance(source, str) and source.isdigit():
+        return int(source)
+    return source
+
+def source_specs(config):
+    """解析配置的 sources 段: 每项含 source (摄像头索引或视频文件), 可选 name、weight 和 detector
+
+    detector 中的参数覆盖顶层 detector 段, 因此每路相机可以有自己的目标区域和阈值。
+    返回 [{"name", "source", "weight", "params"}], 名称重复或参数非法时抛出 ValueError。
+    """
+    base = config.get("detector") or {}
+    specs = []
+    for i, entry in enumerate(config.get("sources") or []):
+        if not isinstance(entry, dict):
+            entry = {"source": entry}
+        if "source" not in entry:
+            raise ValueError(f"sources 第 {i + 1} 项缺少 source")
+        name = str(entry.get("name", f"cam{i}"))
+        if any(spec["name"] == name for spec in specs):
+            raise ValueError(f"sources 名称重复: {name}")
+        weight = float(entry.get("weight", 1.0))
+        if weight <= 0:
+            raise ValueError(f"{name}: weight 应为正数")
+        params = DetectorParams(**dict(base, **(entry.get("detector") or {})))
+        specs.append({"name": name, "source": _parse_source(entry["source"]), "weight": weight, "params": params})
+    return specs
+
+def _load_config(config_path):
+    with open(config_path, "r", encoding="utf-8") as file:
+        return yaml.safe_load(file) or {}
+
+def load_source_specs(config_path):
+    return source_specs(_load_config(config_path))
+
+def load_source_params(config_path, names):
+    """ConfigWatcher 的 loader: 返回 {名称: DetectorParams}; 不在 sources 段中的相机 (例如命令行给出的)
+    使用顶层 detector 段"""
+    config = _load_config(config_path)
+    params = {spec["name"]: spec["params"] for spec in source_specs(config)}
+    base = DetectorParams.from_config(config)
+    return {name: params.get(name, base) for name in names}
+
+
+class CameraVerdict:
+    """多路检测输出的一条判定: 相机名称、判定文本、平滑后落点 (原始分辨率) 及产生时间"""
+
+    __slots__ = ("camera", "verdict", "point", "created", "latency")
+
+    def __init__(self, camera, verdict, point, created, latency):
+        self.camera = camera
+        self.verdict = verdict
+        self.point = point
+        self.created = created
+        self.latency = latency
+
+    def __repr__(self):
+        return f"[{self.camera}] {self.verdict}"
+
+
+class CameraSource:
+    """一路相机: 采集线程、环形缓冲区和独立参数的检测器
+
+    同一时刻最多由一个工作线程处理 (busy), 保证检测器按帧顺序更新光流和落点历史。
+    vtime 为按 weight 折算的累计处理耗时, 调度器总是优先处理 vtime 最小的一路。
+    """
+
+    def __init__(self, name, cap, first_frame, detector, cond, fps=30, ring_size=4, loop_file=False, weight=1.0,
+                 clips=None):
+        self.name = name
+        self.cap = cap
+        self.detector = detector
+        self.weight = weight
+        self.cond = cond
+        self.ring = FrameRing(first_frame.shape, size=ring_size, cond=cond)
+        self.capture = CaptureThread(cap, self.ring, fps=fps, loop_file=loop_file)
+        self.stats = self.capture.stats
+        self.metrics = DetectorMetrics(labels={"camera": name})
+        self.clips = clips
+        self.busy = False
+        self.vtime = 0.0
+        self.busy_seconds = 0.0
+        self.pending_params = None
+
+    def summary(self):
+        text = f"[{self.name}] {self.stats.summary(self.ring.dropped)}, 处理耗时 {self.busy_seconds:.1f}s"
+        if self.detector.gate is not None:
+            text += f", {self.detector.gate.summary()}"
+        if self.clips is not None:
+            text += f", {self.clips.summary()}"
+        return text
+
+
+class MultiCameraRunner:
+    """多路相机共用一组工作线程的检测调度器
+
+    每路相机有自己的采集线程和 FrameRing (满则丢弃最旧帧), 所有 FrameRing 共用一个 Condition,
+    workers 个工作线程在其上等待任意一路出现新帧。取帧时在 "有新帧且未被处理" 的各路中选 vtime
+    (累计处理耗时 / weight) 最小的一路, 因此 CPU 不足时各路按权重平分处理时间, 不会被分辨率大或
+    运动多的一路占满; 长时间无帧的一路恢复时 vtime 被提到当前水位, 不会凭积攒的额度独占工作线程。
+    OpenCV 在光流/CLAHE/Canny 中释放 GIL, 各路检测可在线程间真正并行。
+    各路判定合并为一个 CameraVerdict 队列, 由 run() 依次产出。
+    """
+
+    def __init__(self, sources, workers=None, stats_interval=300, config_path=None, reload_interval=1.0):
+        if not sources:
+            raise ValueError("至少需要一路相机")
+        self.sources = sources
+        self.workers = workers or min(len(sources), os.cpu_count() or 1)
+        self.stats_interval = stats_interval
+        self.events = queue.Queue()
+        self._cond = sources[0].cond
+        self._floor = 0.0
+        self._stop_event = threading.Event()
+        self._threads = []
+        self.watcher = None
+        if config_path is not None:
+            names = [source.name for source in sources]
+            self.watcher = ConfigWatcher(config_path, reload_interval,
+                                         loader=lambda path: load_source_params(path, names))
+
+    def _poll_params(self):
+        params = self.watcher.poll() if self.watcher is not None else None
+        if params is None:
+            return
+        for source in self.sources:
+            if source.name in params:
+                source.pending_params = params[source.name]
+
+    def _acquire(self):
+        """等待并取出下一帧 (source, item); 停止或所有采集线程都已结束时返回 None"""
+        with self._cond:
+            while True:
+                if self._stop_event.is_set():
+                    return None
+                ready = [s for s in self.sources if not s.busy and s.ring.ready and s.capture.running]
+                if ready:
+                    break
+                if not any(s.capture.running for s in self.sources):
+                    return None
+                self._cond.wait(0.5)
+            source = min(ready, key=lambda s: s.vtime)
+            source.vtime = max(source.vtime, self._floor)
+            self._floor = source.vtime
+            source.busy = True
+            return source, source.ring.acquire_latest(timeout=0)
+
+    def _work(self):
+        while True:
+            self._poll_params()
+            acquired = self._acquire()
+            if acquired is None:
+                return
+            source, (idx, frame, stamp, _) = acquired
+            start_time = time.perf_counter()
+            try:
+                # 新参数只在两帧之间切换
+                params, source.pending_params = source.pending_params, None
+                if params is not None:
+                    source.detector = source.detector.reconfigure(params, frame)
+                point, text, emit = source.detector.process(frame)
+                if source.clips is not None:
+                    source.clips.add(frame, source.detector, point, text, emit)
+            except Exception as e:
+                print(f"[{source.name}] 检测出错, 停止该路: {e}")
+                source.capture.stop()
+                continue
+            finally:
+                source.ring.release(idx)
+                now = time.perf_counter()
+                with self._cond:
+                    source.busy_seconds += now - start_time
+                    source.vtime += (now - start_time) / source.weight
+                    source.busy = False
+                    self._cond.notify()
+            source.stats.processed += 1
+            source.stats.record_latency(now - stamp)
+            source.metrics.record(source.detector, now - stamp, source.ring.dropped, text if emit else None)
+            if self.stats_interval and source.stats.processed % self.stats_interval == 0:
+                print(source.summary())
+            if emit:
+                self.events.put(CameraVerdict(source.name, text, point, time.time(), now - stamp))
+
+    def start(self):
+        if self.watcher is not None:
+            self.watcher.start()
+        for source in self.sources:
+            source.capture.start()
+        self._threads = [threading.Thread(target=self._work, daemon=True) for _ in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        with self._cond:
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=1.0)
+        for source in self.sources:
+            source.capture.stop()
+            source.cap.release()
+            if source.clips is not None:
+                source.clips.close()
+        if self.watcher is not None:
+            self.watcher.stop()
+
+    def run(self):
+        """启动调度并逐条产出 CameraVerdict, 所有相机结束后返回"""
+        self.start()
+        try:
+            while any(thread.is_alive() for thread in self._threads) or not self.events.empty():
+                try:
+                    yield self.events.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+        finally:
+            self.stop()
+            for source in self.sources:
+                print(source.summary())
+
+
+def open_sources(specs, fps=30, ring_size=4, roi=False, roi_padding=120, motion_gate=False,
+                 flow_backend="dis_fast", recorder=None):
+    """按 source_specs 的结果打开各路相机并创建检测器; 打不开的一路打印错误后跳过
+
+    recorder 为 ClipRecorder 参数字典时每路各有一个录像器, 录像文件以相机名称开头。
+    """
+    cond = threading.Condition(threading.RLock())
+    sources = []
+    for spec in specs:
+        cap = open_capture(spec["source"], fps)
+        ret, first_frame = cap.read() if cap.isOpened() else (False, None)
+        if not ret:
+            print(f"[{spec['name']}] 无法打开或读取: {spec['source']}")
+            cap.release()
+            continue
+        detector = JetDetector(first_frame, roi=roi, roi_padding=roi_padding, motion_gate=motion_gate,
+                               flow_backend=flow_backend, params=spec["params"])
+        clips = None
+        if recorder is not None:
+            clips = ClipRecorder(fps=fps, name=spec["name"], labels=VERDICT_LABELS, **recorder)
+        sources.append(CameraSource(spec["name"], cap, first_frame, detector, cond, fps, ring_size,
+                                    loop_file=not isinstance(spec["source"], int), weight=spec["weight"],
+                                    clips=clips))
+        print(f"[{spec['name']}] 已打开: {spec['source']}")
+    return sources
+
+def detect_water_jet_multi(sources=None, workers=None, fps=30, ring_size=4, stats_interval=300,
+                           roi=False, roi_padding=120, motion_gate=False, flow_backend="dis_fast",
+                           config_path=None, reload_interval=1.0, recorder=None):
+    """多路相机同时检测水柱落点, 产出带相机名称的 CameraVerdict
+
+    sources 为 source_specs 格式的列表, 省略时从 config_path 的 sources 段读取;
+    config_path 给出时各路参数随文件修改自动重载 (同 detect_water_jet_fast_loop)。
+    workers 默认取相机数与 CPU 核数中较小者。recorder 同 detect_water_jet_fast_loop, 每路分别录像。
+    """
+    if sources is None:
+        if config_path is None:
+            raise ValueError("需要 sources 或含 sources 段的 config_path")
+        sources = load_source_specs(config_path)
+    opened = open_sources(sources, fps, ring_size, roi, roi_padding, motion_gate, flow_backend, recorder)
+    if not opened:
+        print("没有可用的相机")
+        return
+    runner = MultiCameraRunner(opened, workers, stats_interval, config_path, reload_interval)
+    yield from runner.run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多路相机共用工作线程池检测水柱落点")
+    parser.add_argument("sources", nargs="*", help="摄像头索引或视频文件; 省略时读取 --config 的 sources 段")
+    parser.add_argument("--config", help="含 detector / sources 段的 YAML, 修改后自动重载")
+    parser.add_argument("--workers", type=int, default=None, help="工作线程数, 默认 min(相机数, CPU 核数)")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--roi", action="store_true")
+    parser.add_argument("--motion-gate", action="store_true")
+    parser.add_argument("--flow-backend", default="dis_fast")
+    parser.add_argument("--record-dir", help="输出判定时把前后几秒画面录像到该目录 (参数取 --config 的 recorder 段)")
+    parser.add_argument("--opencv-threads", type=int, default=None,
+                        help="OpenCV 内部线程数; 多路并行时设为 1 可避免线程超额订阅")
+    args = parser.parse_args()
+
+    if args.opencv_threads is not None:
+        cv2.setNumThreads(args.opencv_threads)
+    config = _load_config(args.config) if args.config else {}
+    specs = source_specs(dict(config, sources=args.sources)) if args.sources else None
+    recorder = recorder_settings(config)
+    if args.record_dir:
+        recorder = dict(recorder or {}, directory=args.record_dir)
+    events = detect_water_jet_multi(specs, args.workers, args.fps, roi=args.roi, motion_gate=args.motion_gate,
+                                    flow_backend=args.flow_backend, config_path=args.config, recorder=recorder)
+    try:
+        for event in events:
+            print(event)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
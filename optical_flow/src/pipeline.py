@@ -0,0 +1,301 @@
+import time
+import asyncio
+import threading
+import contextlib
+
+import metrics
+from audio_cache import AudioCache
+from multicam import detect_water_jet_multi, source_specs
+from preprocess import VERDICTS, detect_water_jet_fast_loop
+from llm import MpvSink, get_kimi_response, call_tts_stream, audio_play, select_voice, speak_streaming, warm_up
+
+OUTPUT_FILE = "./audio/output.mp3"
+file_format = "mp3"
+
+
+class StageStats:
+    """单个流水线阶段的处理计数、丢弃/出错计数与耗时统计, 同时记入 metrics 的 pipeline_stage_seconds 直方图"""
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.dropped = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.histogram = metrics.histogram("pipeline_stage_seconds", "流水线各阶段耗时 (end_to_end 为判定到播放)",
+                                           {"stage": name})
+        self.drop_counter = metrics.counter("pipeline_dropped_total", "流水线因队列满或过期丢弃的判定数",
+                                            {"stage": name})
+        self.error_counter = metrics.counter("pipeline_errors_total", "流水线各阶段处理出错 (并丢弃该条判定) 的次数",
+                                             {"stage": name})
+
+    def record(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.histogram.observe(seconds)
+
+    def drop(self):
+        self.dropped += 1
+        self.drop_counter.inc()
+
+    def error(self, e):
+        """记录一次处理失败: 打印原因, 该条判定计为丢弃, 流水线继续处理下一条"""
+        print(f"[pipeline] {self.name} 出错, 丢弃该条判定: {type(e).__name__}: {e}")
+        self.errors += 1
+        self.error_counter.inc()
+        self.drop()
+
+    def summary(self):
+        avg = self.total / self.count if self.count else 0.0
+        return f"{self.name}: {self.count} 次, 丢弃 {self.dropped} (出错 {self.errors}), 平均 {avg:.2f}s / 最大 {self.max:.2f}s"
+
+
+class Utterance:
+    """流水线中传递的一条评论: 判定、评论文本、音色、音频、判定产生时间及来源相机 (单路时为 None)"""
+
+    __slots__ = ("verdict", "created", "camera", "text", "voice", "audio", "cached")
+
+    def __init__(self, verdict, created, camera=None):
+        self.verdict = verdict
+        self.created = created
+        self.camera = camera
+        self.text = verdict
+        self.voice = None
+        self.audio = None
+        self.cached = False
+
+
+def put_latest(queue, item, stats):
+    """非阻塞入队; 队列已满时丢弃最旧的一项, 保证下游总拿到最新判定"""
+    while queue.full():
+        queue.get_nowait()
+        queue.task_done()
+        stats.drop()
+    queue.put_nowait(item)
+
+def generate_commentary(verdict, voice, use_kimi=True):
+    """为判定生成一条评论及其语音, 返回 (评论文本, 音频)"""
+    text = get_kimi_response(verdict) if use_kimi else verdict
+    audio = audio_play(call_tts_stream(text, voice))
+    return text, bytes(audio)
+
+def create_audio_cache(config):
+    """按 config.yaml 中的 audio_cache 配置创建缓存, 未启用时返回 None"""
+    settings = config.get("audio_cache") or {}
+    if not settings.get("enabled"):
+        return None
+    use_kimi = not config["model_settings"]["qwen"]
+    return AudioCache(
+        settings.get("dir", "./audio/cache"),
+        generate=lambda verdict, voice: generate_commentary(verdict, voice, use_kimi),
+        audio_setting=config["tts_settings"]["audio_setting"],
+        variants=settings.get("variants", 3),
+        max_bytes=int(settings.get("max_mb", 50) * 1024 * 1024),
+        deterministic=not use_kimi,
+    )
+
+
+class CommentaryPipeline:
+    """检测 -> 评论生成 -> TTS -> 播放 的分阶段流水线
+
+    检测生成器在后台线程运行, 不会被网络请求或播放阻塞; 各阶段之间是有界队列,
+    队列满时丢弃旧判定, 取出时超过 max_age 秒的判定也视为过期丢弃。
+    stream_audio=True 时 TTS 音频块到达即写入常驻 mpv (MpvSink) 播放,
+    播放阶段只负责按 archive 保存文件; 否则整段合成后再启动 mpv 播放文件。
+    启用 audio_cache 时命中缓存的判定跳过评论生成和 TTS, 直接进入播放阶段。
+    incremental_tts=True 时 Kimi 生成和 TTS 合并在 TTS 阶段按句流水执行 (speak_streaming)。
+    config 含非空 sources 段时忽略 source, 用 detect_water_jet_multi 同时检测多路相机,
+    各路判定带相机名称进入同一条流水线。
+    """
+
+    def __init__(self, source, config, queue_size=1, max_age=5.0, stats_interval=30.0,
+                 stream_audio=True, archive=True, incremental_tts=True, **detect_kwargs):
+        self.source = source
+        self.config = config
+        self.stream_audio = stream_audio
+        self.archive = archive
+        self.use_kimi = not config["model_settings"]["qwen"]
+        self.incremental_tts = incremental_tts and self.use_kimi
+        self.sink = None
+        self.cache = create_audio_cache(config)
+        self.queue_size = queue_size
+        self.max_age = max_age
+        self.stats_interval = stats_interval
+        self.detect_kwargs = detect_kwargs
+        self.sources = source_specs(config)
+        self.stats = {name: StageStats(name) for name in ("detect", "commentary", "tts", "play")}
+        self.end_to_end = StageStats("end_to_end")
+        self._stop_event = threading.Event()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.verdicts = asyncio.Queue(maxsize=self.queue_size)
+        self.comments = asyncio.Queue(maxsize=self.queue_size)
+        self.audios = asyncio.Queue(maxsize=self.queue_size)
+        if self.stream_audio:
+            self.sink = MpvSink().start()
+        if self.cache is not None and not self.config["tts_change"]:
+            # 固定音色时启动即为每种判定补足缓存变体; 随机音色按需填充
+            self.cache.prefill(VERDICTS, select_voice())
+        detector = threading.Thread(target=self._detect, args=(loop,), daemon=True)
+        detector.start()
+        tasks = [
+            asyncio.create_task(self._commentary_worker()),
+            asyncio.create_task(self._tts_worker()),
+            asyncio.create_task(self._play_worker()),
+            # 后台预热 Kimi/MiniMax 连接, 不阻塞检测启动
+            asyncio.create_task(asyncio.to_thread(warm_up)),
+        ]
+        if self.stats_interval:
+            tasks.append(asyncio.create_task(self._report()))
+        try:
+            await asyncio.gather(*tasks[:3])
+        finally:
+            self._stop_event.set()
+            for task in tasks:
+                task.cancel()
+            if self.sink is not None:
+                self.sink.close()
+            self.print_stats()
+
+    def _detect(self, loop):
+        """后台线程: 迭代检测生成器, 把判定投递到事件循环"""
+        stats = self.stats["detect"]
+        if self.sources:
+            events = ((event.verdict, event.camera)
+                      for event in detect_water_jet_multi(self.sources, **self.detect_kwargs))
+        else:
+            events = ((text, None) for text in detect_water_jet_fast_loop(self.source, **self.detect_kwargs))
+        try:
+            for text, camera in events:
+                if self._stop_event.is_set():
+                    break
+                if text:
+                    stats.count += 1
+                    loop.call_soon_threadsafe(put_latest, self.verdicts, Utterance(text, time.time(), camera), stats)
+        except Exception as e:
+            print(f"[pipeline] 检测出错, 停止流水线: {type(e).__name__}: {e}")
+        finally:
+            # 检测结束 (相机断开、视频读完或出错), 用 None 通知下游各阶段退出
+            loop.call_soon_threadsafe(put_latest, self.verdicts, None, stats)
+
+    def _is_stale(self, utterance, stats):
+        if self.max_age and time.time() - utterance.created > self.max_age:
+            stats.drop()
+            return True
+        return False
+
+    async def _commentary_worker(self):
+        stats = self.stats["commentary"]
+        while True:
+            utterance = await self.verdicts.get()
+            self.verdicts.task_done()
+            if utterance is None:
+                put_latest(self.comments, None, stats)
+                return
+            if self._is_stale(utterance, stats):
+                continue
+            tag = f"[{utterance.camera}] " if utterance.camera else ""
+            print(f"Processing text: {tag}{utterance.verdict}")
+            utterance.voice = select_voice()
+            try:
+                if self.cache is not None:
+                    hit = await asyncio.to_thread(self.cache.get, utterance.verdict, utterance.voice)
+                    if hit is not None:
+                        utterance.text, utterance.audio = hit
+                        utterance.cached = True
+                        put_latest(self.audios, utterance, stats)
+                        continue
+                start_time = time.time()
+                if self.use_kimi and not self.incremental_tts:
+                    utterance.text = await asyncio.to_thread(get_kimi_response, utterance.verdict)
+            except Exception as e:
+                # 超时、重试耗尽、缺少密钥等只影响这一条判定
+                stats.error(e)
+                continue
+            stats.record(time.time() - start_time)
+            put_latest(self.comments, utterance, stats)
+
+    async def _tts_worker(self):
+        stats = self.stats["tts"]
+        while True:
+            utterance = await self.comments.get()
+            self.comments.task_done()
+            if utterance is None:
+                put_latest(self.audios, None, stats)
+                return
+            start_time = time.time()
+            try:
+                utterance.audio = await asyncio.to_thread(self._synthesize, utterance)
+            except Exception as e:
+                stats.error(e)
+                continue
+            stats.record(time.time() - start_time)
+            if self.cache is not None and utterance.audio:
+                try:
+                    await asyncio.to_thread(self.cache.put, utterance.verdict, utterance.voice,
+                                            utterance.text, utterance.audio)
+                except OSError as e:
+                    print(f"[pipeline] 写入语音缓存失败: {e}")
+            put_latest(self.audios, utterance, stats)
+
+    def _sink_lock(self):
+        """独占播放器直到整段语音写完; 流式合成 (TTS 线程) 和缓存命中 (播放阶段) 会同时写入同一个 mpv"""
+        return self.sink.lock if self.sink is not None else contextlib.nullcontext()
+
+    def _synthesize(self, utterance):
+        archive = self.archive or not self.stream_audio or self.cache is not None
+        with self._sink_lock():
+            if self.incremental_tts:
+                utterance.text, audio = speak_streaming(utterance.verdict, utterance.voice, sink=self.sink,
+                                                        archive=archive)
+                return audio
+            return audio_play(call_tts_stream(utterance.text, utterance.voice), sink=self.sink, archive=archive)
+
+    def _play_cached(self, audio):
+        with self._sink_lock():
+            self.sink.write(audio)
+
+    async def _play_worker(self):
+        stats = self.stats["play"]
+        while True:
+            utterance = await self.audios.get()
+            self.audios.task_done()
+            if utterance is None:
+                return
+            audio = utterance.audio
+            self.end_to_end.record(time.time() - utterance.created)
+            if self.stream_audio and utterance.cached:
+                # 流式合成的语音已在 TTS 阶段写入播放器, 缓存命中的语音在这里整段写入
+                await asyncio.to_thread(self._play_cached, audio)
+            # 非流式播放时 mpv 从文件播放, 因此总是需要写文件
+            if not self.stream_audio or (self.archive and not utterance.cached and audio):
+                timestamp = int(time.time())
+                file_name = f"./audio/{OUTPUT_FILE.split('.')[0]}_{timestamp}.{file_format}"
+                with open(file_name, 'wb') as file:
+                    file.write(audio)
+                print(f"Audio saved to {file_name}")
+            if self.stream_audio:
+                continue
+            start_time = time.time()
+            mpv_process = await asyncio.create_subprocess_exec(
+                "mpv", "--no-cache", "--no-terminal", file_name,
+                stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL)
+            await mpv_process.wait()
+            stats.record(time.time() - start_time)
+
+    async def _report(self):
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            self.print_stats()
+
+    def print_stats(self):
+        print(f"[pipeline] 队列深度 verdict={self.verdicts.qsize()} "
+              f"comment={self.comments.qsize()} audio={self.audios.qsize()}")
+        for stats in list(self.stats.values()) + [self.end_to_end]:
+            print(f"[pipeline] {stats.summary()}")
+        if self.cache is not None:
+            print(f"[pipeline] {self.cache.summary()}")
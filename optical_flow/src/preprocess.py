@@ -3,6 +3,19 @@ import time
 
 import numpy as np
 
+import metrics
+from capture import CaptureThread, FrameRing, mjpeg_reduction, open_capture, open_mjpeg_capture
+from detector_config import ConfigWatcher, DetectorParams, load_detector_params
+from recorder import ClipRecorder
+from tracker import create_tracker, find_lowest_point
+
+# 每帧记录耗时的处理阶段, 顺序与 JetDetector.stage_times 对应
+STAGES = ("resize", "clahe", "gate", "dis", "canny", "threshold", "classify")
+# JetDetector.classify 可能给出的全部判定
+VERDICTS = ("落点在正中央", "落点差点出去了", "落点在区域中，但不是很好", "落点不在区域中")
+# 录像叠加用的 ASCII 标签, 与 VERDICTS 一一对应 (cv2.putText 不支持中文)
+VERDICT_LABELS = dict(zip(VERDICTS, ("CENTER", "ALMOST OUT", "IN REGION", "OUT OF REGION")))
+
 
 def create_clahe():
     """创建并返回CLAHE对象用于对比度增强"""
@@ -20,6 +33,13 @@ def compute_optical_flow(prev_gray, gray, dis_flow):
     mag, ang = cv2.cartToPolar(flow[..., 0], flow[..., 1])
     return mag, ang, flow
 
+def roi_bounds(region, padding, frame_shape):
+    """根据目标区域(x, y, w, h)和外扩像素计算裁剪范围 (x0, y0, x1, y1), 限制在画面内"""
+    x, y, w, h = region
+    frame_height, frame_width = frame_shape[:2]
+    return (max(0, x - padding), max(0, y - padding),
+            min(frame_width, x + w + padding), min(frame_height, y + h + padding))
+
 def visualize_flow(frame, mag, ang, scale):
     """将光流可视化为HSV图像"""
     hsv = np.zeros_like(frame)
@@ -29,24 +49,616 @@ def visualize_flow(frame, mag, ang, scale):
     flow_rgb = cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
     return cv2.resize(flow_rgb, (0, 0), fx=1/scale, fy=1/scale)
 
-def detect_water_jet_fast_loop(camera_index=0, scale=0.5, max_history=5, fps=30):
-    """检测水柱在水池中的落点并输出坐标"""
-    # cap = cv2.VideoCapture(video_path)
-    print(2222222222222)
-    cap = cv2.VideoCapture(camera_index, cv2.CAP_V4L2)
+def percentile_positive(values, nonzero, q, scratch):
+    """计算非负数组中正值的第 q 百分位数 (与 np.percentile(values[values > 0], q) 一致)
+
+    values 非负, 排序后正值恰好占据末尾 nonzero 个位置, 因此在预分配的 scratch
+    上原地 partition 即可取到所需的两个顺序统计量, 不需要布尔索引拷贝。
+    """
+    flat = scratch.reshape(-1)
+    np.copyto(scratch, values)
+    zeros = flat.size - nonzero
+    index = q / 100 * (nonzero - 1)
+    lo = int(index)
+    hi = min(lo + 1, nonzero - 1)
+    flat.partition([zeros + lo, zeros + hi])
+    a, b = flat[zeros + lo], flat[zeros + hi]
+    return a + (b - a) * (index - lo)
+
+class DISBackend:
+    """DIS 稠密光流 (preset: ultrafast / fast / medium)"""
+
+    PRESETS = {
+        "ultrafast": cv2.DISOPTICAL_FLOW_PRESET_ULTRAFAST,
+        "fast": cv2.DISOPTICAL_FLOW_PRESET_FAST,
+        "medium": cv2.DISOPTICAL_FLOW_PRESET_MEDIUM,
+    }
+
+    def __init__(self, preset="fast"):
+        self.name = f"dis_{preset}"
+        self.dis_flow = cv2.DISOpticalFlow_create(self.PRESETS[preset])
+
+    def calc(self, prev_gray, gray, flow_x, flow_y):
+        # DIS 传入非空 flow 会被当作初值改变结果, 因此输出仍由 OpenCV 分配
+        flow = self.dis_flow.calc(prev_gray, gray, None)
+        cv2.extractChannel(flow, 0, dst=flow_x)
+        cv2.extractChannel(flow, 1, dst=flow_y)
+
+
+class FarnebackBackend:
+    """Farneback 稠密光流, 比 DIS fast 慢但对细小水柱更平滑"""
+
+    name = "farneback"
+
+    def calc(self, prev_gray, gray, flow_x, flow_y):
+        flow = cv2.calcOpticalFlowFarneback(prev_gray, gray, None, 0.5, 3, 15, 3, 5, 1.2, 0)
+        cv2.extractChannel(flow, 0, dst=flow_x)
+        cv2.extractChannel(flow, 1, dst=flow_y)
+
+
+class LucasKanadeBackend:
+    """稀疏 Lucas-Kanade: 在上一帧角点上跟踪, 把每个角点的位移画成半径 radius 的圆盘得到近似稠密光流"""
+
+    name = "lk"
+
+    def __init__(self, max_corners=400, radius=4):
+        self.max_corners = max_corners
+        self.radius = radius
+
+    def calc(self, prev_gray, gray, flow_x, flow_y):
+        flow_x.fill(0)
+        flow_y.fill(0)
+        corners = cv2.goodFeaturesToTrack(prev_gray, self.max_corners, 0.01, 5)
+        if corners is None:
+            return
+        tracked, status, _ = cv2.calcOpticalFlowPyrLK(prev_gray, gray, corners, None)
+        for (x, y), (tx, ty), ok in zip(corners.reshape(-1, 2), tracked.reshape(-1, 2), status.reshape(-1)):
+            if ok:
+                center = (int(x), int(y))
+                cv2.circle(flow_x, center, self.radius, float(tx - x), -1)
+                cv2.circle(flow_y, center, self.radius, float(ty - y), -1)
+
+
+class FrameDiffBackend:
+    """纯帧差: 用灰度差的绝对值代替光流幅值, 最快但不区分运动方向"""
+
+    name = "framediff"
+
+    def __init__(self):
+        self._diff = None
+
+    def calc(self, prev_gray, gray, flow_x, flow_y):
+        if self._diff is None or self._diff.shape != gray.shape:
+            self._diff = np.empty_like(gray)
+        cv2.absdiff(prev_gray, gray, dst=self._diff)
+        flow_x[...] = self._diff
+        flow_y.fill(0)
+
+
+# 可选光流后端, 按名称创建; 顺序大致从快到慢
+FLOW_BACKENDS = {
+    "framediff": FrameDiffBackend,
+    "lk": LucasKanadeBackend,
+    "dis_ultrafast": lambda: DISBackend("ultrafast"),
+    "dis_fast": lambda: DISBackend("fast"),
+    "farneback": FarnebackBackend,
+    "dis_medium": lambda: DISBackend("medium"),
+}
+REFERENCE_BACKEND = "dis_medium"  # 标定时作为精度基准
+
+
+def create_flow_backend(name):
+    if name not in FLOW_BACKENDS:
+        raise ValueError(f"未知的光流后端: {name}, 可选: {', '.join(FLOW_BACKENDS)}")
+    return FLOW_BACKENDS[name]()
+
+
+class MotionGate:
+    """廉价的运动门控: 在目标区域附近的缩小灰度图上做帧差, 场景静止时跳过光流等昂贵阶段
+
+    每帧把 region_slice 内的灰度图按 downsample 倍缩小 (INTER_AREA), 与上一帧相差超过
+    pixel_threshold 的像素占比不低于 min_fraction 即认为有运动; 出现运动后至少保持 hold_frames
+    帧全速处理, 静止期间每 probe_interval 帧仍完整处理一帧 (0 表示不探测)。
+    """
+
+    def __init__(self, gray, region_slice=None, downsample=4, pixel_threshold=12, min_fraction=0.002,
+                 hold_frames=30, probe_interval=0):
+        self.region_slice = region_slice if region_slice is not None else (slice(None), slice(None))
+        self.pixel_threshold = pixel_threshold
+        self.hold_frames = hold_frames
+        self.probe_interval = probe_interval
+        height, width = gray[self.region_slice].shape
+        self.size = (max(1, width // downsample), max(1, height // downsample))
+        self._tiny = [np.empty((self.size[1], self.size[0]), dtype=np.uint8) for _ in range(2)]
+        self._prev = 0
+        self._diff = np.empty_like(self._tiny[0])
+        self.min_pixels = max(1, int(min_fraction * self._diff.size))
+        cv2.resize(gray[self.region_slice], self.size, dst=self._tiny[0], interpolation=cv2.INTER_AREA)
+        self._hold = hold_frames  # 启动时先全速处理
+        self._idle = 0
+        self.frames = 0
+        self.skipped = 0
+
+    def update(self, gray):
+        """输入当前帧灰度图, 返回本帧是否需要完整处理"""
+        cur = 1 - self._prev
+        cv2.resize(gray[self.region_slice], self.size, dst=self._tiny[cur], interpolation=cv2.INTER_AREA)
+        cv2.absdiff(self._tiny[cur], self._tiny[self._prev], dst=self._diff)
+        cv2.compare(self._diff, self.pixel_threshold, cv2.CMP_GT, dst=self._diff)
+        self._prev = cur
+        self.frames += 1
+        if cv2.countNonZero(self._diff) >= self.min_pixels:
+            self._hold = self.hold_frames
+        elif self._hold > 0:
+            self._hold -= 1
+        active = self._hold > 0 or (self.probe_interval and self._idle + 1 >= self.probe_interval)
+        if active:
+            self._idle = 0
+        else:
+            self._idle += 1
+            self.skipped += 1
+        return bool(active)
+
+    @property
+    def skip_ratio(self):
+        return self.skipped / self.frames if self.frames else 0.0
+
+    def summary(self):
+        return f"运动门控: {self.frames} 帧, 跳过 {self.skipped} 帧 ({self.skip_ratio:.0%})"
+
+
+class JetDetector:
+    """水柱落点检测器: 保存上一帧灰度图、落点平滑历史与目标区域几何
+
+    roi=True 时只在目标区域外扩 roi_padding 像素的范围内做 CLAHE/光流/Canny,
+    落点坐标再映射回原始分辨率。
+    默认为无界面快速路径: 所有中间结果写入初始化时预分配的缓冲区, 不做可视化;
+    debug=True 时才生成光流图/落点标注并 imshow 显示。
+    motion_gate 为 True 或 MotionGate 参数字典 (另可含 padding, 门控区域相对目标区域的外扩像素)
+    时启用运动门控, 静止帧只做缩放/灰度/CLAHE 以保持 prev_gray 最新, 跳过光流和边缘检测。
+    flow_backend 为 FLOW_BACKENDS 中的名称, 默认 DIS fast; 可用 calibrate_flow_backend 按实测速度选择。
+    params (DetectorParams) 给出区域几何、阈值与输出间隔, 提供时忽略 scale/max_history 参数;
+    运行中可用 reconfigure 切换参数。
+    input_reduction > 1 表示输入帧已按 1/input_reduction 解码 (MjpegCapture, 灰度或彩色),
+    区域几何仍按原始分辨率配置, 只对输入再缩放 scale * input_reduction 倍 (为 1 时跳过缩放)。
+    """
+
+    def __init__(self, first_frame, scale=0.5, max_history=5, roi=False, roi_padding=120, debug=False,
+                 motion_gate=False, flow_backend="dis_fast", params=None, input_reduction=1):
+        params = params or DetectorParams(scale=scale, max_history=max_history)
+        scale = params.scale
+        self.scale = scale
+        self.debug = debug
+        self.tracker = None
+        self.smoothed_point = None
+        self.measured_point = None
+        self.frame_count = 0
+        self.input_reduction = input_reduction
+        self._input_scale = scale * input_reduction
+        # 原始分辨率下的画面尺寸, 区域几何都按它计算
+        self.frame_shape = (first_frame.shape[0] * input_reduction, first_frame.shape[1] * input_reduction)
+        self._options = {"roi": roi, "roi_padding": roi_padding, "debug": debug,
+                         "motion_gate": motion_gate, "flow_backend": flow_backend, "input_reduction": input_reduction}
+        self._apply_params(params)
+
+        if roi:
+            region = (self.region_x, self.region_y, self.region_width, self.region_height)
+            x0, y0, x1, y1 = roi_bounds(region, roi_padding, self.frame_shape)
+            # 裁剪边界对齐到 input_reduction 的整数倍, 使缩小后的输入与原始坐标一一对应
+            r = input_reduction
+            x0, y0, x1, y1 = x0 // r * r, y0 // r * r, -(-x1 // r) * r, -(-y1 // r) * r
+            self.roi_slice = (slice(y0 // r, y1 // r), slice(x0 // r, x1 // r))
+            self.roi_offset = np.array([x0, y0])
+        else:
+            self.roi_slice = None
+            self.roi_offset = np.zeros(2, dtype=int)
+
+        self.clahe = create_clahe()
+        self.flow_backend = create_flow_backend(flow_backend)
+        if first_frame.ndim == 3 and self._input_scale != 1:
+            prev_gray, resized_frame = preprocess_frame(self.crop(first_frame), self._input_scale, self.clahe)
+        else:
+            resized_frame = self.crop(first_frame)
+            if self._input_scale != 1:
+                resized_frame = cv2.resize(resized_frame, (0, 0), fx=self._input_scale, fy=self._input_scale)
+            first_gray = resized_frame if resized_frame.ndim == 2 else cv2.cvtColor(resized_frame, cv2.COLOR_BGR2GRAY)
+            prev_gray = self.clahe.apply(first_gray)
+
+        # 预分配工作缓冲区, 灰度图两块交替作为 prev/cur
+        height, width = prev_gray.shape
+        self._resized = np.empty_like(resized_frame)
+        self._raw_gray = np.empty((height, width), dtype=np.uint8)
+        self._gray = [prev_gray, np.empty_like(prev_gray)]
+        self._prev = 0
+        self._flow_x = np.empty((height, width), dtype=np.float32)
+        self._flow_y = np.empty_like(self._flow_x)
+        self._mag = np.empty_like(self._flow_x)
+        self._ang = np.empty_like(self._flow_x)
+        self._norm = np.empty_like(self._flow_x)
+        self._scratch = np.empty_like(self._flow_x)
+        self._motion_mask = np.empty((height, width), dtype=np.uint8)
+        self._edges = np.empty_like(self._motion_mask)
+        self._jet_mask = np.empty_like(self._motion_mask)
+        self._row_max = np.empty((height, 1), dtype=np.uint8)
+        self.stage_times = np.zeros(len(STAGES))  # 最近一帧各阶段耗时(秒)
+        self.gate = None
+        if motion_gate:
+            first_gray = resized_frame if resized_frame.ndim == 2 else cv2.cvtColor(resized_frame, cv2.COLOR_BGR2GRAY)
+            options = {} if motion_gate is True else dict(motion_gate)
+            self.gate = self._create_gate(first_gray, self.frame_shape, options)
+
+    def _apply_params(self, params):
+        """按参数预先计算目标区域、中心框、边缘带和各阈值, 每次 (重新) 配置时执行一次而不是每帧"""
+        tracker_changed = self.tracker is None or any(
+            getattr(params, key) != getattr(self.params, key)
+            for key in ("tracker", "kalman_process_noise", "kalman_measurement_noise", "tracker_jump"))
+        self.params = params
+        self.max_history = params.max_history
+        if tracker_changed:
+            self.tracker = create_tracker(params)
+        else:
+            self.tracker.resize(params.max_history)
+        self.region_x, self.region_y, self.region_width, self.region_height = params.region
+        # 计算中心区域
+        self.center_point = (self.region_x + self.region_width // 2, self.region_y + self.region_height // 2)
+        # print(f"中央区域坐标 (x, y): {center_point}, 区域大小: {region_width}x{region_height}")
+        # 定义中心点附近区域（默认 5% x 5%）
+        frame_height, frame_width = self.frame_shape[:2]
+        self.center_region_width = int(frame_width * params.center_ratio)
+        self.center_region_height = int(frame_height * params.center_ratio)
+        self.center_region_x = self.center_point[0] - self.center_region_width // 2
+        self.center_region_y = self.center_point[1] - self.center_region_height // 2
+        # 定义边缘区域（默认距边界 10% 宽度/高度）
+        self.edge_margin_x = int(self.region_width * params.edge_ratio)
+        self.edge_margin_y = int(self.region_height * params.edge_ratio)
+        # 归一化幅值是浮点数, "取整后 > t" 等价于 ">= t + 1"
+        self._motion_min = params.motion_threshold + 1
+
+    def reconfigure(self, params, frame):
+        """在两帧之间切换参数, 返回之后使用的检测器
+
+        scale 或目标区域变化会影响缓冲区尺寸/ROI 裁剪/门控区域, 此时以当前帧为首帧重建检测器
+        (保留帧计数以维持输出节奏); 其余参数原地生效。目标区域不在画面内或重建失败时打印原因并保留原检测器,
+        不中断检测循环。
+        """
+        if params.scale != self.params.scale or params.region != self.params.region:
+            x0, y0, x1, y1 = roi_bounds(params.region, 0, self.frame_shape)
+            if x1 <= x0 or y1 <= y0:
+                print(f"目标区域 {list(params.region)} 不在画面 {self.frame_shape[1]}x{self.frame_shape[0]} 内, "
+                      f"保留原参数")
+                return self
+            try:
+                detector = JetDetector(frame, params=params, **self._options)
+            except cv2.error as e:
+                print(f"按新参数重建检测器失败, 保留原参数: {e}")
+                return self
+            detector.frame_count = self.frame_count
+            return detector
+        self._apply_params(params)
+        return self
+
+    def _create_gate(self, first_gray, frame_shape, options):
+        """门控区域为目标区域外扩 padding 像素, 换算到裁剪并缩放后的灰度图坐标"""
+        region = (self.region_x, self.region_y, self.region_width, self.region_height)
+        x0, y0, x1, y1 = roi_bounds(region, options.pop("padding", 60), frame_shape)
+        x0, x1 = (np.array([x0, x1]) - self.roi_offset[0]) * self.scale
+        y0, y1 = (np.array([y0, y1]) - self.roi_offset[1]) * self.scale
+        height, width = first_gray.shape
+        region_slice = (slice(max(0, int(y0)), min(height, int(np.ceil(y1)))),
+                        slice(max(0, int(x0)), min(width, int(np.ceil(x1)))))
+        return MotionGate(first_gray, region_slice, **options)
+
+    @property
+    def prev_gray(self):
+        return self._gray[self._prev]
+
+    def crop(self, frame):
+        """ROI 模式下返回目标区域附近的视图(不拷贝), 否则原样返回"""
+        if self.roi_slice is None:
+            return frame
+        return frame[self.roi_slice]
+
+    def classify(self, display_point):
+        """判断落点(原始分辨率)与中央区域的关系, 返回判定文本"""
+        region_x, region_y = self.region_x, self.region_y
+        region_width, region_height = self.region_width, self.region_height
+        if (region_x <= display_point[0] <= region_x + region_width) and \
+           (region_y <= display_point[1] <= region_y + region_height):
+            # 在中央区域内
+            if (self.center_region_x <= display_point[0] <= self.center_region_x + self.center_region_width) and \
+               (self.center_region_y <= display_point[1] <= self.center_region_y + self.center_region_height):
+                return "落点在正中央"
+            elif (display_point[0] <= region_x + self.edge_margin_x or \
+                  display_point[0] >= region_x + region_width - self.edge_margin_x or \
+                  display_point[1] <= region_y + self.edge_margin_y or \
+                  display_point[1] >= region_y + region_height - self.edge_margin_y):
+                return "落点差点出去了"
+            else:
+                return "落点在区域中，但不是很好"
+        # 在中央区域外
+        return "落点不在区域中"
+
+    def measure(self, frame):
+        """对一帧做光流+边缘检测, 返回缩放坐标下的最低水柱点 (x, y) 或 None
+
+        启用运动门控且本帧静止时只更新 prev_gray, 直接返回 None。
+        """
+        stage_times = self.stage_times
+        cur = 1 - self._prev
+        prev_gray, gray = self._gray[self._prev], self._gray[cur]
+
+        # 预处理: 缩放 -> 灰度 -> CLAHE (已按目标分辨率解码的输入跳过缩放, 灰度输入跳过颜色转换)
+        t0 = time.perf_counter()
+        resized = self.crop(frame)
+        if self._input_scale != 1:
+            cv2.resize(resized, (0, 0), dst=self._resized, fx=self._input_scale, fy=self._input_scale)
+            resized = self._resized
+        elif self.debug:
+            np.copyto(self._resized, resized)  # show() 在本帧之后使用
+        raw_gray = resized
+        if resized.ndim == 3:
+            cv2.cvtColor(resized, cv2.COLOR_BGR2GRAY, dst=self._raw_gray)
+            raw_gray = self._raw_gray
+        t1 = time.perf_counter()
+        self.clahe.apply(raw_gray, dst=gray)
+        t2 = time.perf_counter()
+        stage_times[0] = t1 - t0
+        stage_times[1] = t2 - t1
+        self._prev = cur
+
+        # 运动门控: 静止帧跳过光流/边缘/阈值阶段
+        if self.gate is not None:
+            active = self.gate.update(raw_gray)
+            stage_times[2] = time.perf_counter() - t2
+            if not active:
+                stage_times[3:6] = 0.0
+                return None
+        else:
+            stage_times[2] = 0.0
+        return self._detect(prev_gray, gray)
+
+    def _detect(self, prev_gray, gray):
+        stage_times = self.stage_times
+        t2 = time.perf_counter()
+        # 计算光流
+        self.flow_backend.calc(prev_gray, gray, self._flow_x, self._flow_y)
+        mag, _ = cv2.cartToPolar(self._flow_x, self._flow_y, magnitude=self._mag, angle=self._ang)
+        t3 = time.perf_counter()
+
+        # 边缘检测
+        params = self.params
+        cv2.Canny(gray, params.canny_low, params.canny_high, edges=self._edges)
+        t4 = time.perf_counter()
+
+        # 运动掩膜: 归一化到 0-255 后取整数部分 > motion_threshold, 再与边缘相交
+        cv2.normalize(mag, self._norm, 0, 255, cv2.NORM_MINMAX)
+        cv2.compare(self._norm, self._motion_min, cv2.CMP_GE, dst=self._motion_mask)
+        cv2.bitwise_and(self._motion_mask, self._edges, dst=self._motion_mask)
+
+        # 过滤高速运动区域（水柱）: 幅值高于正值的 jet_percentile 百分位
+        lowest_point = None
+        nonzero = cv2.countNonZero(mag)
+        if nonzero:
+            threshold = percentile_positive(mag, nonzero, params.jet_percentile, self._scratch)
+            cv2.compare(mag, float(threshold), cv2.CMP_GT, dst=self._jet_mask)
+            cv2.bitwise_and(self._jet_mask, self._motion_mask, dst=self._jet_mask)
+            # 检测落点
+            if cv2.countNonZero(self._jet_mask) > params.min_jet_pixels:
+                # 选择最下方的点（y坐标最大）, 同一行取最左侧
+                lowest_point = find_lowest_point(self._jet_mask, self._row_max)
+        t5 = time.perf_counter()
+
+        stage_times[3] = t3 - t2
+        stage_times[4] = t4 - t3
+        stage_times[5] = t5 - t4
+        return lowest_point
+
+    def track(self, lowest_point):
+        """按帧顺序平滑落点并判定, 返回 (落点坐标或None, 判定文本或None, 是否需要输出)
+
+        只依赖 measure 的结果, 因此离线分片时可以并行 measure、在合并阶段顺序 track。
+        """
+        t0 = time.perf_counter()
+        self.frame_count += 1
+        self.measured_point = lowest_point
+        display_point, text = None, None
+
+        # 平滑处理 (滑动平均或卡尔曼滤波, 见 tracker.py)
+        smoothed_point = self.tracker.update(lowest_point)
+        if smoothed_point is not None:
+            # 输出落点坐标（原始分辨率, ROI 模式下加回裁剪偏移）
+            display_point = (smoothed_point / self.scale).astype(int) + self.roi_offset
+            # print(f"Water Jet Landing Point (x, y)v: {tuple(display_point)}")
+
+            # 判断落点与中央区域关系
+            text = self.classify(display_point)
+        self.smoothed_point = smoothed_point
+        self.stage_times[6] = time.perf_counter() - t0
+
+        emit = text is not None and self.frame_count % self.params.emit_interval == 0  # 默认每30帧输出一次
+        return display_point, text, emit
+
+    @property
+    def velocity(self):
+        """落点速度 (原始分辨率像素/帧)"""
+        return self.tracker.velocity / self.scale
+
+    def process(self, frame):
+        """处理一帧, 返回 (落点坐标或None, 判定文本或None, 是否需要输出)"""
+        result = self.track(self.measure(frame))
+        if self.debug:
+            self.show(self.smoothed_point)
+        return result
+
+    def show(self, smoothed_point):
+        """调试模式: 绘制落点、中央区域, 显示检测结果/光流/边缘图像"""
+        scale = self.scale
+        detection_result = self._resized.copy() if self._resized.ndim == 3 else \
+            cv2.cvtColor(self._resized, cv2.COLOR_GRAY2BGR)
+        if smoothed_point is not None:
+            smoothed_point = np.asarray(smoothed_point).astype(int)
+            # 绘制落点
+            cv2.circle(detection_result, tuple(smoothed_point), 6, (0, 0, 255), -1)
+            cv2.putText(detection_result, 'Jet Landing',
+                        tuple(smoothed_point + np.array([10, -10])),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
+        # 绘制中央区域和中心点（缩放分辨率, 相对裁剪区域）
+        region_x, region_y = self.region_x - self.roi_offset[0], self.region_y - self.roi_offset[1]
+        region_top_left_scaled = (int(region_x * scale), int(region_y * scale))
+        region_bottom_right_scaled = (int((region_x + self.region_width) * scale), int((region_y + self.region_height) * scale))
+        center_point_scaled = ((np.array(self.center_point) - self.roi_offset) * scale).astype(int)
+        cv2.rectangle(detection_result, region_top_left_scaled, region_bottom_right_scaled, (0, 255, 0), 2)
+        cv2.circle(detection_result, tuple(center_point_scaled), 6, (0, 255, 0), -1)
+        cv2.putText(detection_result, 'Center',
+                    tuple(center_point_scaled + np.array([10, -10])),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+
+        # 显示结果
+        display_result = cv2.resize(detection_result, (0, 0), fx=1/scale, fy=1/scale)
+        edges_display = cv2.resize(self._edges, (0, 0), fx=1/scale, fy=1/scale)
+        flow_rgb_display = visualize_flow(detection_result, self._mag, self._ang, scale)
+
+        cv2.imshow("Detection Result", display_result)
+        cv2.imshow("Optical Flow", flow_rgb_display)
+        cv2.imshow("Edges (Canny)", edges_display)
+
+
+class DetectorMetrics:
+    """检测循环的指标: 处理帧数、丢帧、帧率、各阶段耗时、采集到判定的延迟和各判定输出次数
+
+    labels 附加到每个指标上 (例如多路检测时的 {"camera": 名称})。
+    """
+
+    def __init__(self, registry=metrics.REGISTRY, fps_interval=1.0, labels=None):
+        labels = labels or {}
+        self.frames = registry.counter("detector_frames_total", "已处理的帧数", labels)
+        self.dropped = registry.counter("detector_dropped_frames_total", "采集环形缓冲区丢弃的帧数", labels)
+        self.fps = registry.gauge("detector_fps", "最近 fps_interval 秒的处理帧率", labels)
+        self.latency = registry.histogram("detector_latency_seconds", "采集到判定的延迟", labels)
+        self.stages = [registry.histogram("detector_stage_seconds", "检测各阶段耗时", dict(labels, stage=stage))
+                       for stage in STAGES]
+        self.verdicts = {verdict: registry.counter("detector_verdicts_total", "输出的判定次数",
+                                                   dict(labels, verdict=verdict))
+                         for verdict in VERDICTS}
+        self.fps_interval = fps_interval
+        self._dropped_seen = 0
+        self._window_start = time.perf_counter()
+        self._window_frames = 0
+
+    def record(self, detector, latency, dropped=None, verdict=None):
+        """记录一帧; dropped 为累计丢帧数"""
+        self.frames.inc()
+        for histogram, seconds in zip(self.stages, detector.stage_times.tolist()):
+            if seconds > 0:  # 门控跳过的阶段耗时为 0, 不计入
+                histogram.observe(seconds)
+        self.latency.observe(latency)
+        if dropped is not None and dropped > self._dropped_seen:
+            self.dropped.inc(dropped - self._dropped_seen)
+            self._dropped_seen = dropped
+        if verdict is not None:
+            self.verdicts[verdict].inc()
+        self._window_frames += 1
+        now = time.perf_counter()
+        if now - self._window_start >= self.fps_interval:
+            self.fps.set(self._window_frames / (now - self._window_start))
+            self._window_start = now
+            self._window_frames = 0
+
+
+def _same_point(a, b, tolerance):
+    if a is None or b is None:
+        return a is None and b is None
+    return np.hypot(a[0] - b[0], a[1] - b[1]) <= tolerance
+
+def calibrate_flow_backend(frames, target_fps=30, scale=0.5, roi=False, roi_padding=120, candidates=None,
+                           tolerance=20, input_reduction=1, params=None):
+    """在样本帧上实测各光流后端的速度与精度, 返回 (选中的后端名, 报告列表)
+
+    以基准后端 (REFERENCE_BACKEND) 的结果为准, 统计逐帧判定一致的比例 (accuracy) 和平滑后落点
+    (原始分辨率) 相距不超过 tolerance 像素的比例 (point_accuracy)。在达到 target_fps 的后端中
+    依次按 accuracy、point_accuracy、速度选最好的; 都达不到时选最快的。
+    params (DetectorParams) 给出时按其区域几何与阈值标定 (忽略 scale), 与实际检测一致。
+    """
+    candidates = list(candidates or FLOW_BACKENDS)
+    results, speed = {}, {}
+    for name in dict.fromkeys([REFERENCE_BACKEND] + candidates):
+        detector = JetDetector(frames[0], scale, roi=roi, roi_padding=roi_padding, flow_backend=name,
+                               params=params, input_reduction=input_reduction)
+        rows = []
+        start_time = time.perf_counter()
+        for frame in frames[1:]:
+            rows.append(detector.track(detector.measure(frame))[:2])
+        elapsed = time.perf_counter() - start_time
+        results[name] = rows
+        speed[name] = len(rows) / elapsed if elapsed > 0 else float("inf")
+
+    reference = results[REFERENCE_BACKEND]
+    total = max(len(reference), 1)
+    report = []
+    for name in candidates:
+        pairs = list(zip(results[name], reference))
+        report.append({
+            "backend": name,
+            "fps": speed[name],
+            "accuracy": sum(1 for (_, a), (_, b) in pairs if a == b) / total,
+            "point_accuracy": sum(1 for (a, _), (b, _) in pairs if _same_point(a, b, tolerance)) / total,
+        })
+    eligible = [r for r in report if r["fps"] >= target_fps]
+    if eligible:
+        best = max(eligible, key=lambda r: (r["accuracy"], r["point_accuracy"], r["fps"]))
+    else:
+        best = max(report, key=lambda r: r["fps"])
+    return best["backend"], report
+
+def print_calibration(report, chosen, target_fps):
+    print(f"光流后端标定 (目标 {target_fps:.0f} FPS, 精度基准 {REFERENCE_BACKEND}):")
+    for r in report:
+        mark = "*" if r["backend"] == chosen else " "
+        print(f" {mark} {r['backend']:<14}{r['fps']:>8.1f} FPS  判定一致 {r['accuracy']:.1%}  "
+              f"落点一致 {r['point_accuracy']:.1%}")
+
+def detect_water_jet_fast_loop(camera_index=0, scale=0.5, max_history=5, fps=30,
+                               threaded=True, ring_size=4, stats_interval=300,
+                               roi=False, roi_padding=120, debug=False, motion_gate=False,
+                               flow_backend="dis_fast", calibration_seconds=2.0, config_path=None,
+                               reload_interval=1.0, mjpeg_gray=False, recorder=None):
+    """检测水柱在水池中的落点并输出坐标
+
+    threaded=True 时由后台线程采集帧写入 FrameRing (满则丢弃最旧帧),
+    处理循环总是取最新一帧, 避免慢帧阻塞采集导致延迟累积。
+    roi=True 时只处理目标区域附近, 可配合 scale=1.0 以全分辨率精度运行。
+    debug=True 时显示检测结果/光流/边缘窗口, 按 ESC 退出。
+    motion_gate 启用运动门控 (见 JetDetector), 场景静止时跳过光流, 有运动时自动恢复全速处理。
+    flow_backend="auto" 时先读取 calibration_seconds 秒的帧, 选出在本机能达到 fps 的最准确光流后端。
+    config_path 指向含 detector 段的 YAML 时从中读取区域/阈值等参数 (覆盖 scale/max_history),
+    并每 reload_interval 秒检查文件, 修改后在下一帧之前生效, 无需重启相机。
+    mjpeg_gray=True 时读取原始 MJPEG 数据, 直接解码为接近 scale 的 1/2 或 1/4 分辨率灰度图
+    (debug 时解码为彩色以便叠加显示), 省去全分辨率解码、缩放和颜色转换; 源不是 MJPEG 时回退到普通解码。
+    recorder 为 ClipRecorder 参数字典 (见 recorder.recorder_settings) 时, 每次输出判定把前后几秒画面
+    在后台线程写成带叠加标注的 MP4。
+    """
+    params = DetectorParams(scale=scale, max_history=max_history)
+    watcher = None
+    if config_path is not None:
+        params = load_detector_params(config_path)
+        # 此时记下文件修改时间, 轮询线程等到检测循环开始前才启动, 提前返回时不会遗留线程
+        watcher = ConfigWatcher(config_path, reload_interval)
+
+    cap, input_reduction = None, 1
+    if mjpeg_gray:
+        input_reduction = mjpeg_reduction(params.scale)
+        cap = open_mjpeg_capture(camera_index, fps, input_reduction, color=debug)
+        if cap is None:
+            print("源不支持原始 MJPEG 读取, 使用普通解码")
+            input_reduction = 1
+    if cap is None:
+        cap = open_capture(camera_index, fps)
     if not cap.isOpened():
         print("无法读取视频文件")
         return
     else:
         print("摄像头已打开")
 
-    # 设置 MJPG 格式（更适合高帧率）
-    cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
-    # 设置分辨率和帧率（根据摄像头支持）
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
-    cap.set(cv2.CAP_PROP_FPS, fps)
-    
     # 初始化
     ret, first_frame = cap.read()
     if not ret:
@@ -54,120 +666,63 @@ def detect_water_jet_fast_loop(camera_index=0, scale=0.5, max_history=5, fps=30)
         cap.release()
         return
 
-    clahe = create_clahe()
-    prev_gray, _ = preprocess_frame(first_frame, scale, clahe)
-    dis_flow = cv2.DISOpticalFlow_create(cv2.DISOPTICAL_FLOW_PRESET_FAST)
-    history_points = []
+    if flow_backend == "auto":
+        frames = [first_frame]
+        while len(frames) < max(2, int(calibration_seconds * fps)):
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(frame)
+        flow_backend, report = calibrate_flow_backend(frames, fps, params.scale, roi, roi_padding,
+                                                      input_reduction=input_reduction, params=params)
+        print_calibration(report, flow_backend, fps)
+        first_frame = frames[-1]
+
+    detector = JetDetector(first_frame, roi=roi, roi_padding=roi_padding, debug=debug,
+                           motion_gate=motion_gate, flow_backend=flow_backend, params=params,
+                           input_reduction=input_reduction)
+    clips = ClipRecorder(fps=fps, labels=VERDICT_LABELS, **recorder) if recorder is not None else None
+    if watcher is not None:
+        watcher.start()
+    try:
+        if threaded:
+            loop_file = not isinstance(camera_index, int)
+            yield from _threaded_loop(cap, detector, first_frame.shape, fps, ring_size, stats_interval, loop_file,
+                                      watcher, clips)
+        else:
+            yield from _serial_loop(cap, detector, fps, watcher, clips)
+    finally:
+        cap.release()
+        if clips is not None:
+            clips.close()
+            print(clips.summary())
+        if watcher is not None:
+            watcher.stop()
+        if debug:
+            cv2.destroyAllWindows()
+
+def _serial_loop(cap, detector, fps, watcher=None, clips=None):
+    """串行模式: 读取、处理、按 fps 休眠"""
     frame_delay = 1.0 / fps
-    frame_count = 0
-
-    # 计算中心区域
-    region_x, region_y =  465, 242
-    region_width, region_height = 119, 215
-    center_point = (region_x + region_width // 2, region_y + region_height // 2)
-    # print(f"中央区域坐标 (x, y): {center_point}, 区域大小: {region_width}x{region_height}")
-    # 定义中心点附近区域（5% x 5%）
-    frame_height, frame_width = first_frame.shape[:2]
-    center_region_width = int(frame_width * 0.05)
-    center_region_height = int(frame_height * 0.05)
-    center_region_x = center_point[0] - center_region_width // 2
-    center_region_y = center_point[1] - center_region_height // 2
-    # 定义边缘区域（距边界 10% 宽度/高度）
-    edge_margin_x = int(region_width * 0.1)
-    edge_margin_y = int(region_height * 0.1)
-    
+    frame_metrics = DetectorMetrics()
     while True:
         start_time = time.time()
+        stamp = time.perf_counter()
 
         ret, frame = cap.read()
         if not ret:
             cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
             continue
-        
-        frame_count += 1
-            
-        gray, resized_frame = preprocess_frame(frame, scale, clahe) # 预处理
-        mag, ang, flow = compute_optical_flow(prev_gray, gray, dis_flow) # 计算光流
-        flow_rgb_display = visualize_flow(resized_frame, mag, ang, scale) # 可视化光流
-        motion_mask = cv2.normalize(mag, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8) # 运动掩膜
-        _, motion_mask = cv2.threshold(motion_mask, 25, 255, cv2.THRESH_BINARY)
 
-        # 边缘检测
-        edges = cv2.Canny(gray, 50, 150)
-        motion_mask = cv2.bitwise_and(motion_mask, edges)
-
-        # 过滤高速运动区域（水柱）
-        jet_mask = mag > np.percentile(mag[mag > 0], 95) if np.any(mag > 0) else np.zeros_like(mag, dtype=bool)
-        jet_mask = jet_mask & (motion_mask.astype(bool))
-
-        detection_result = resized_frame.copy()
-
-        # 检测落点
-        if np.sum(jet_mask) > 50:
-            coords = np.column_stack(np.where(jet_mask))
-            # print(f"Jet mask pixels: {np.sum(jet_mask)}, Valid coords: {len(coords)}")  # 调试输出
-
-            if len(coords) > 10:
-                # 选择最下方的点（y坐标最大）
-                lowest_point = coords[np.argmax(coords[:, 0])][::-1]  # 转换为(x, y)
-                
-                # 平滑处理
-                history_points.append(lowest_point)
-                if len(history_points) > max_history:
-                    history_points.pop(0)
-                smoothed_point = np.mean(history_points, axis=0).astype(int)
-
-                # 输出落点坐标（原始分辨率）
-                display_point = (smoothed_point / scale).astype(int)
-                # print(f"Water Jet Landing Point (x, y)v: {tuple(display_point)}")
-
-                # 判断落点与中央区域关系
-                if (region_x <= display_point[0] <= region_x + region_width) and \
-                   (region_y <= display_point[1] <= region_y + region_height):
-                    # 在中央区域内
-                    if (center_region_x <= display_point[0] <= center_region_x + center_region_width) and \
-                       (center_region_y <= display_point[1] <= center_region_y + center_region_height):
-                        text = "落点在正中央"
-                    elif (display_point[0] <= region_x + edge_margin_x or \
-                          display_point[0] >= region_x + region_width - edge_margin_x or \
-                          display_point[1] <= region_y + edge_margin_y or \
-                          display_point[1] >= region_y + region_height - edge_margin_y):
-                        text = "落点差点出去了"
-                    else:
-                        text = "落点在区域中，但不是很好"
-                else:
-                    # 在中央区域外
-                    text = "落点不在区域中"
-                
-                # print(f"Text: {text}")
-
-                if text and frame_count % 30 == 0:  # 每30帧输出一次
-                    yield text
-
-                # 绘制落点
-                cv2.circle(detection_result, tuple(smoothed_point), 6, (0, 0, 255), -1)
-                cv2.putText(detection_result, 'Jet Landing',
-                            tuple(smoothed_point + np.array([10, -10])),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
-        # 绘制中央区域和中心点（缩放分辨率）
-        region_top_left_scaled = (int(region_x * scale), int(region_y * scale))
-        region_bottom_right_scaled = (int((region_x + region_width) * scale), int((region_y + region_height) * scale))
-        center_point_scaled = (np.array(center_point) * scale).astype(int)
-        # cv2.rectangle(detection_result, region_top_left_scaled, region_bottom_right_scaled, (0, 255, 0), 2)
-        # cv2.circle(detection_result, center_point_scaled, 6, (0, 255, 0), -1)
-        # cv2.putText(detection_result, 'Center',
-                    # (center_point_scaled + np.array([10, -10])).astype(int),
-                    # cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
-        
-        # 显示结果
-        # display_result = cv2.resize(detection_result, (0, 0), fx=1/scale, fy=1/scale)
-        # edges_display = cv2.resize(edges, (0, 0), fx=1/scale, fy=1/scale)
-
-        # cv2.imshow("Detection Result", display_result)
-        # cv2.imshow("Optical Flow", flow_rgb_display)
-        # cv2.imshow("Edges (Canny)", edges_display)
-
-        prev_gray = gray.copy()
+        params = watcher.poll() if watcher is not None else None
+        if params is not None:
+            detector = detector.reconfigure(params, frame)
+        point, text, emit = detector.process(frame)
+        if clips is not None:
+            clips.add(frame, detector, point, text, emit)
+        frame_metrics.record(detector, time.perf_counter() - stamp, verdict=text if emit else None)
+        if emit:
+            yield text
 
         # 帧率控制
         elapsed = time.time() - start_time
@@ -175,11 +730,52 @@ def detect_water_jet_fast_loop(camera_index=0, scale=0.5, max_history=5, fps=30)
         if remaining > 0:
             time.sleep(remaining)
 
-        if cv2.waitKey(1) & 0xFF == 27:  # ESC退出
+        if detector.debug and cv2.waitKey(1) & 0xFF == 27:  # ESC退出
             break
 
-    cap.release()
-    cv2.destroyAllWindows()
+def _threaded_loop(cap, detector, frame_shape, fps, ring_size, stats_interval, loop_file, watcher=None,
+                   clips=None):
+    """线程模式: 采集线程写环形缓冲区, 本循环只处理最新帧"""
+    ring = FrameRing(frame_shape, size=ring_size)
+    capture = CaptureThread(cap, ring, fps=fps, loop_file=loop_file)
+    stats = capture.stats
+    frame_metrics = DetectorMetrics()
+    capture.start()
+    try:
+        while capture.running:
+            item = ring.acquire_latest(timeout=1.0)
+            if item is None:
+                continue
+            idx, frame, stamp, _ = item
+            try:
+                # 新参数只在两帧之间切换
+                params = watcher.poll() if watcher is not None else None
+                if params is not None:
+                    detector = detector.reconfigure(params, frame)
+                point, text, emit = detector.process(frame)
+                if clips is not None:
+                    # 录像在归还缓冲区之前取走缩小后的副本
+                    clips.add(frame, detector, point, text, emit)
+            finally:
+                ring.release(idx)
+            stats.processed += 1
+            latency = time.perf_counter() - stamp
+            stats.record_latency(latency)
+            frame_metrics.record(detector, latency, ring.dropped, text if emit else None)
+            if stats_interval and stats.processed % stats_interval == 0:
+                print(stats.summary(ring.dropped))
+                if detector.gate is not None:
+                    print(detector.gate.summary())
+            if emit:
+                yield text
+
+            if detector.debug and cv2.waitKey(1) & 0xFF == 27:  # ESC退出
+                break
+    finally:
+        capture.stop()
+        print(stats.summary(ring.dropped))
+        if detector.gate is not None:
+            print(detector.gate.summary())
 
 if __name__ == '__main__':
     # detect_water_jet_fast_loop('./demo/normal.mp4')
@@ -0,0 +1,272 @@
+import os
+import json
+import time
+import queue
+import threading
+from collections import deque
+
+import cv2
+import numpy as np
+
+import metrics
+
+CLIP_SUFFIX = ".mp4"
+
+
+def recorder_settings(config):
+    """按 config.yaml 中的 recorder 段返回 ClipRecorder 参数, 未启用时返回 None"""
+    settings = dict(config.get("recorder") or {})
+    if not settings.pop("enabled", False):
+        return None
+    if "dir" in settings:
+        settings["directory"] = settings.pop("dir")
+    return settings
+
+
+def _lower_priority(niceness):
+    """降低当前线程的调度优先级 (Linux 上线程有独立的 nice 值), 使检测循环优先获得 CPU; 不支持时忽略"""
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), niceness)
+    except (AttributeError, OSError):
+        pass
+
+
+class _Clip:
+    """正在收集的一段录像: JPEG 帧列表、结束时间和段内输出的判定"""
+
+    __slots__ = ("frames", "nbytes", "end", "limit", "events", "created")
+
+    def __init__(self, frames, end, limit):
+        self.frames = list(frames)
+        self.nbytes = sum(len(frame[0]) for frame in self.frames)
+        self.end = end
+        self.limit = limit
+        self.events = []
+        self.created = time.time()
+
+
+class ClipRecorder:
+    """判定精彩片段录像: 在内存中保留最近 pre_seconds 秒画面, 输出判定时把前后几秒写成带叠加标注的 MP4
+
+    检测循环每帧调用 add, 只把画面缩小到 scale (相对原始分辨率) 并投入有界队列 (满则丢弃该帧, 不等待);
+    压缩线程把帧编码为 JPEG 放入预录缓冲, 收到判定后预录画面并入片段并继续收集 post_seconds 秒,
+    期间再有判定则延长, 单段最长 max_seconds 秒; 预录缓冲和收集中的片段都不超过 buffer_mb (超过时提前结束片段)。
+    收集完成的片段交给写入线程解码、绘制目标区域/中央区域/落点/判定并编码为 MP4 (同名 .json 记录段内判定),
+    写入后按 keep_days、max_clips、max_mb 清理目录中最旧的录像。
+    labels 把判定文本映射为叠加显示用的 ASCII 标签 (cv2.putText 不支持中文)。
+    两个后台线程以 niceness 降低调度优先级, CPU 紧张时让出给检测循环 (录像丢帧, 检测不丢帧)。
+    单帧 JPEG 超过 buffer_mb 时预录缓冲至少保留最新一帧 (即上限退化为一帧)。
+    """
+
+    def __init__(self, directory="./clips", fps=30, pre_seconds=3.0, post_seconds=2.0, max_seconds=15.0,
+                 buffer_mb=64, scale=0.5, quality=80, max_clips=100, max_mb=500, keep_days=7, name="clip",
+                 labels=None, queue_size=8, max_pending_clips=4, niceness=10):
+        if buffer_mb <= 0:
+            raise ValueError(f"buffer_mb 应为正数: {buffer_mb}")
+        self.directory = directory
+        self.fps = fps
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        self.max_seconds = max_seconds
+        self.buffer_bytes = int(buffer_mb * 1024 * 1024)
+        self.scale = scale
+        self.quality = quality
+        self.max_clips = max_clips
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.keep_seconds = keep_days * 86400 if keep_days else None
+        self.name = name
+        self.labels = labels or {}
+        self.niceness = niceness
+        self.clips = 0
+        self.dropped_frames = 0
+        self.dropped_clips = 0
+        self._frames = queue.Queue(maxsize=queue_size)
+        self._pending = queue.Queue(maxsize=max_pending_clips)
+        self._preroll = deque()
+        self._preroll_bytes = 0
+        self._clip = None
+        labels = {"camera": name}
+        self._clip_counter = metrics.counter("recorder_clips_total", "已写入的录像段数", labels)
+        self._drop_counter = {what: metrics.counter("recorder_dropped_total", "录像丢弃的帧/片段数",
+                                                    dict(labels, what=what))
+                              for what in ("frame", "clip")}
+        self._write_time = metrics.histogram("recorder_write_seconds", "一段录像的编码写入耗时", labels)
+        os.makedirs(directory, exist_ok=True)
+        self._compressor = threading.Thread(target=self._compress_loop, daemon=True)
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._compressor.start()
+        self._writer.start()
+
+    def add(self, frame, detector, point=None, text=None, emit=False):
+        """检测循环调用: 记录一帧及其落点 (原始分辨率)、判定和目标区域; emit 为 True 时触发录像"""
+        height, width = detector.frame_shape[:2]
+        if width * self.scale < frame.shape[1]:
+            small = cv2.resize(frame, (int(width * self.scale), int(height * self.scale)),
+                               interpolation=cv2.INTER_AREA)
+        else:
+            small = frame.copy()
+        overlay = (point, text, emit, detector.params.region,
+                   (detector.center_region_x, detector.center_region_y,
+                    detector.center_region_width, detector.center_region_height),
+                   small.shape[1] / width)
+        try:
+            self._frames.put_nowait((small, time.perf_counter(), overlay))
+            return
+        except queue.Full:
+            self.dropped_frames += 1
+            self._drop_counter["frame"].inc()
+        if emit:
+            # 触发帧不能丢, 改为丢弃队列中最旧的一帧 (只有检测循环写入, 取出后必有空位)
+            try:
+                self._frames.get_nowait()
+            except queue.Empty:
+                pass
+            self._frames.put_nowait((small, time.perf_counter(), overlay))
+
+    def _compress_loop(self):
+        _lower_priority(self.niceness)
+        params = [cv2.IMWRITE_JPEG_QUALITY, self.quality]
+        while True:
+            item = self._frames.get()
+            if item is None:
+                if self._clip is not None:
+                    self._finish_clip()
+                self._pending.put(None)
+                return
+            small, stamp, overlay = item
+            try:
+                ok, jpeg = cv2.imencode(".jpg", small, params)
+                if ok:
+                    self._push((jpeg.tobytes(), stamp, overlay))
+            except Exception as e:
+                # 压缩线程退出后队列会被填满, 只丢弃这一帧
+                print(f"录像压缩失败: {e}")
+
+    def _push(self, frame):
+        jpeg, stamp, (point, text, emit) = frame[0], frame[1], frame[2][:3]
+        if self._clip is None and emit:
+            # 预录缓冲连同本帧成为片段开头, 之后的帧直接进入片段
+            self._preroll.append(frame)
+            self._clip = _Clip(self._preroll, stamp + self.post_seconds, self._preroll[0][1] + self.max_seconds)
+            self._preroll.clear()
+            self._preroll_bytes = 0
+        elif self._clip is not None:
+            self._clip.frames.append(frame)
+            self._clip.nbytes += len(jpeg)
+            if emit:
+                self._clip.end = min(stamp + self.post_seconds, self._clip.limit)
+        else:
+            self._preroll.append(frame)
+            self._preroll_bytes += len(jpeg)
+            # 预录缓冲只保留 pre_seconds 秒且不超过内存上限, 至少保留本帧
+            while len(self._preroll) > 1 and (self._preroll[0][1] < stamp - self.pre_seconds or
+                                              self._preroll_bytes > self.buffer_bytes):
+                self._preroll_bytes -= len(self._preroll.popleft()[0])
+            return
+        if emit:
+            self._clip.events.append((time.time(), text, point))
+        if stamp >= self._clip.end or self._clip.nbytes > self.buffer_bytes:
+            self._finish_clip()
+
+    def _finish_clip(self):
+        clip, self._clip = self._clip, None
+        try:
+            self._pending.put_nowait(clip)
+        except queue.Full:
+            self.dropped_clips += 1
+            self._drop_counter["clip"].inc()
+
+    def _write_loop(self):
+        _lower_priority(self.niceness)
+        while True:
+            clip = self._pending.get()
+            if clip is None:
+                return
+            start_time = time.perf_counter()
+            try:
+                self._write_clip(clip)
+                self.prune()
+            except Exception as e:
+                print(f"录像写入失败: {e}")
+                continue
+            self.clips += 1
+            self._clip_counter.inc()
+            self._write_time.observe(time.perf_counter() - start_time)
+
+    def _write_clip(self, clip):
+        stamps = [frame[1] for frame in clip.frames]
+        duration = stamps[-1] - stamps[0]
+        fps = (len(stamps) - 1) / duration if duration > 0 else self.fps  # 按实际处理帧率播放, 保持原速
+        fps = max(1.0, round(fps, 1))  # MPEG-4 时基分母不能超过 65535, 帧率保留一位小数
+        created = time.localtime(clip.created)
+        base = f"{self.name}_{time.strftime('%Y%m%d_%H%M%S', created)}_{int(clip.created * 1000) % 1000:03d}"
+        path = os.path.join(self.directory, base + CLIP_SUFFIX)
+        tmp_path = os.path.join(self.directory, "." + base + CLIP_SUFFIX)  # 写完再改名, 清理时不会计入半成品
+        writer = None
+        for jpeg, _, overlay in clip.frames:
+            image = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if writer is None:
+                writer = cv2.VideoWriter(tmp_path, cv2.VideoWriter_fourcc(*"mp4v"), fps,
+                                         (image.shape[1], image.shape[0]))
+                if not writer.isOpened():
+                    raise RuntimeError(f"无法创建 {tmp_path} ({image.shape[1]}x{image.shape[0]}, {fps} FPS)")
+            self.draw_overlay(image, overlay)
+            writer.write(image)
+        writer.release()
+        os.replace(tmp_path, path)
+        info = {"camera": self.name, "created": clip.created, "frames": len(clip.frames), "fps": fps,
+                "events": [{"time": t, "verdict": verdict, "point": None if point is None else [int(v) for v in point]}
+                           for t, verdict, point in clip.events]}
+        with open(os.path.join(self.directory, base + ".json"), "w", encoding="utf-8") as file:
+            json.dump(info, file, ensure_ascii=False, indent=1)
+        print(f"录像已保存到 {path} ({len(clip.frames)} 帧)")
+
+    def draw_overlay(self, image, overlay):
+        """在录像帧上绘制目标区域 (绿框)、中央区域、落点 (红点) 和判定"""
+        point, text, emit, region, center, ratio = overlay
+        x, y, w, h = (int(v * ratio) for v in region)
+        cv2.rectangle(image, (x, y), (x + w, y + h), (0, 255, 0), 2)
+        cx, cy, cw, ch = (int(v * ratio) for v in center)
+        cv2.rectangle(image, (cx, cy), (cx + cw, cy + ch), (0, 255, 0), 1)
+        if point is not None:
+            cv2.circle(image, (int(point[0] * ratio), int(point[1] * ratio)), 6, (0, 0, 255), -1)
+        if text is not None:
+            color = (0, 255, 255) if emit else (255, 255, 255)
+            cv2.putText(image, self.labels.get(text, text), (10, 25), cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
+
+    def prune(self):
+        """删除超过 keep_days 的录像, 再按从旧到新删除直到不超过 max_clips 段和 max_mb"""
+        clips = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(CLIP_SUFFIX) and not entry.name.startswith("."):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                clips.append((stat.st_mtime, stat.st_size, entry.path))
+        clips.sort()
+        total = sum(size for _, size, _ in clips)
+        now = time.time()
+        while clips and (len(clips) > self.max_clips or total > self.max_bytes or
+                         (self.keep_seconds and now - clips[0][0] > self.keep_seconds)):
+            _, size, path = clips.pop(0)
+            total -= size
+            for stale in (path, path[:-len(CLIP_SUFFIX)] + ".json"):
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:
+                    pass
+
+    def close(self, timeout=10.0):
+        """停止录像: 正在收集的片段按已有画面写出, 等待写入线程完成; 最多等待约 timeout 秒, 不阻塞检测循环退出"""
+        try:
+            self._frames.put(None, timeout=timeout)
+        except queue.Full:
+            print("录像压缩线程无响应, 放弃未写出的片段")
+            return
+        self._compressor.join(timeout)
+        self._writer.join(timeout)
+
+    def summary(self):
+        return (f"录像 {self.name}: {self.clips} 段, 丢弃 {self.dropped_frames} 帧 / {self.dropped_clips} 段, "
+                f"预录缓冲 {self._preroll_bytes / 1024 / 1024:.1f} MB")
@@ -0,0 +1,113 @@
+import os
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+from bench import trace_row, write_results, compare_results
+from preprocess import JetDetector
+
+
+def _init_worker():
+    # 进程间已经并行, 关闭 OpenCV 内部线程避免超额订阅
+    cv2.setNumThreads(1)
+
+def measure_shard(video_path, start, end, scale=0.5, roi=False, roi_padding=120):
+    """测量视频第 [start, end) 帧的最低水柱点 (end 为 None 时读到结尾)
+
+    先定位到 start - 1 帧作为预热帧初始化光流的 prev_gray, 因此分片之间只重叠一帧。
+    """
+    cap = cv2.VideoCapture(video_path)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start - 1)
+    ret, warmup_frame = cap.read()
+    if not ret:
+        cap.release()
+        return []
+
+    detector = JetDetector(warmup_frame, scale, roi=roi, roi_padding=roi_padding)
+    points = []
+    frame_index = start
+    while end is None or frame_index < end:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        points.append(detector.measure(frame))
+        frame_index += 1
+    cap.release()
+    return points
+
+def split_frames(frame_count, shards):
+    """将第 1..frame_count-1 帧 (第 0 帧只作为首帧) 均分为 shards 段, 最后一段读到结尾
+
+    帧数未知 (视频流或部分容器的 CAP_PROP_FRAME_COUNT 为 0) 或不足两帧时只返回一段 (1, None)。
+    """
+    if frame_count <= 1:
+        return [(1, None)]
+    total = max(frame_count - 1, 1)
+    shards = max(1, min(shards, total))
+    step = -(-total // shards)
+    bounds = [(start, start + step) for start in range(1, frame_count, step)]
+    bounds[-1] = (bounds[-1][0], None)
+    return bounds
+
+def analyze_video_sharded(video_path, workers=None, shards=None, scale=0.5, max_history=5,
+                          roi=False, roi_padding=120):
+    """多进程分片分析视频, 返回与顺序运行一致的落点轨迹
+
+    光流测量 (measure) 在各分片内并行; 平滑和判定 (track) 依赖前序落点,
+    在合并阶段按帧顺序执行, 因此结果与 JetDetector.process 逐帧运行完全相同。
+    """
+    workers = workers or os.cpu_count()
+    cap = cv2.VideoCapture(video_path)
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    ret, first_frame = cap.read()
+    cap.release()
+    if not ret:
+        raise RuntimeError(f"无法读取视频文件: {video_path}")
+
+    bounds = split_frames(frame_count, shards or workers * 4)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = [pool.submit(measure_shard, video_path, start, end, scale, roi, roi_padding)
+                   for start, end in bounds]
+        # 按分片顺序合并, 保证 track 看到的落点顺序与顺序运行相同
+        detector = JetDetector(first_frame, scale, max_history, roi=roi, roi_padding=roi_padding)
+        trace = []
+        for future in futures:
+            for lowest_point in future.result():
+                point, text, emit = detector.track(lowest_point)
+                trace.append(trace_row(video_path, detector.frame_count, point, text, emit))
+    return trace
+
+def main():
+    parser = argparse.ArgumentParser(description="多进程分片离线分析录像中的水柱落点")
+    parser.add_argument("videos", nargs="+")
+    parser.add_argument("--workers", type=int, default=None, help="进程数, 默认 CPU 核数")
+    parser.add_argument("--shards", type=int, default=None, help="分片数, 默认进程数 x 4")
+    parser.add_argument("--scale", type=float, default=0.5)
+    parser.add_argument("--max-history", type=int, default=5)
+    parser.add_argument("--roi", action="store_true")
+    parser.add_argument("--roi-padding", type=int, default=120)
+    parser.add_argument("--output", help="结果输出路径 (.json 或 .csv)")
+    parser.add_argument("--compare", help="与 bench.py 保存的 JSON 结果对比落点轨迹")
+    args = parser.parse_args()
+
+    results = []
+    for video_path in args.videos:
+        start_time = time.perf_counter()
+        trace = analyze_video_sharded(video_path, args.workers, args.shards, args.scale,
+                                      args.max_history, args.roi, args.roi_padding)
+        seconds = time.perf_counter() - start_time
+        fps = len(trace) / seconds if seconds > 0 else 0.0
+        print(f"{video_path}: {len(trace)} 帧, {seconds:.2f} 秒, {fps:.1f} FPS")
+        results.append({"video": video_path, "frames": len(trace), "seconds": seconds,
+                        "fps": fps, "detect_fps": fps, "trace": trace})
+    if args.output:
+        write_results(results, args.output)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as file:
+            compare_results(json.load(file), results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+# python -m pytest -q optical_flow/src
+import numpy as np
+
+from detector_config import DetectorParams
+from preprocess import JetDetector
+from tracker import MovingAverageTracker
+
+
+def test_resize_empty_tracker():
+    tracker = MovingAverageTracker(5)
+    tracker.resize(8)
+    assert tracker.count == 0
+    assert list(tracker.update((10, 20))) == [10, 20]
+
+
+def test_resize_keeps_latest_points():
+    tracker = MovingAverageTracker(4)
+    for x in (0, 10, 20, 30):
+        tracker.update((x, 0))
+    tracker.resize(2)
+    assert tracker.count == 2
+    assert list(tracker.update((40, 0))) == [35, 0]  # 保留 30, 再加入 40
+    tracker.resize(3)
+    assert list(tracker.update((50, 0))) == [40, 0]
+
+
+def test_reconfigure_history_before_first_point():
+    frame = np.zeros((120, 160, 3), dtype=np.uint8)
+    detector = JetDetector(frame, params=DetectorParams(region=[40, 30, 80, 60]))
+    detector = detector.reconfigure(DetectorParams(region=[40, 30, 80, 60], max_history=8), frame)
+    assert detector.max_history == 8
@@ -0,0 +1,143 @@
+import cv2
+import numpy as np
+
+# 可选的落点跟踪器, 与 config.yaml detector.tracker 对应
+TRACKERS = ("average", "kalman")
+
+
+def find_lowest_point(mask, row_max):
+    """返回掩膜中最下方一行最左侧的非零像素 (x, y); row_max 为预分配的 (height, 1) uint8 缓冲区
+
+    按行 REDUCE_MAX 标出有水柱像素的行, 只对行向量和该行像素做 argmax, 不生成全部非零坐标。
+    调用方需保证掩膜非空。
+    """
+    cv2.reduce(mask, 1, cv2.REDUCE_MAX, dst=row_max)
+    y = len(row_max) - 1 - int(np.argmax(row_max[::-1, 0]))
+    x = int(np.argmax(mask[y]))
+    return x, y
+
+
+class MovingAverageTracker:
+    """最近 size 个落点的滑动平均, 取整到像素 (与原先 history_points 列表的结果一致)
+
+    落点保存在固定容量的 NumPy 环形缓冲区中并维护累加和, 每帧开销与 size 无关。
+    velocity 为相邻两次输出位置之差除以间隔帧数 (像素/帧)。
+    """
+
+    def __init__(self, size=5):
+        self._points = np.zeros((size, 2), dtype=np.int64)
+        self._sum = np.zeros(2, dtype=np.int64)
+        self._next = 0
+        self.count = 0
+        self.position = None
+        self.velocity = np.zeros(2)
+        self._since_update = 0
+
+    def resize(self, size):
+        """修改窗口大小, 保留最近的 min(count, size) 个落点"""
+        if size == len(self._points):
+            return
+        kept = [self._points[(self._next - self.count + i) % len(self._points)] for i in range(self.count)][-size:]
+        self._points = np.zeros((size, 2), dtype=np.int64)
+        if kept:
+            self._points[:len(kept)] = kept
+        self._sum = self._points.sum(axis=0)
+        self.count = len(kept)
+        self._next = self.count % size
+
+    def update(self, point):
+        """输入本帧落点 (缩放坐标) 或 None, 返回平滑后的位置; 本帧没有落点时返回 None, 历史保留"""
+        self._since_update += 1
+        if point is None:
+            return None
+        if self.count == len(self._points):
+            self._sum -= self._points[self._next]
+        else:
+            self.count += 1
+        self._points[self._next] = point
+        self._sum += self._points[self._next]
+        self._next = (self._next + 1) % len(self._points)
+        position = (self._sum / self.count).astype(int)
+        if self.position is not None:
+            self.velocity = (position - self.position) / self._since_update
+        self.position = position
+        self._since_update = 0
+        return position
+
+
+class KalmanTracker:
+    """匀速模型卡尔曼滤波 (cv2.KalmanFilter), 状态为 (x, y, vx, vy), 单位为缩放后像素和像素/帧
+
+    每帧预测一次, 有落点时校正, 输出亚像素位置。与预测相距超过 jump 像素的落点先视为离群点
+    (本帧输出预测位置, 计入 rejected); 若下一帧落点与它相距不超过 jump, 说明水柱确实突然移动,
+    直接以新落点重新初始化, 只滞后一帧而不是被平滑窗口拖慢。连续 max_missed 帧没有落点时也重新初始化。
+    """
+
+    def __init__(self, process_noise=1.0, measurement_noise=4.0, jump=50.0, max_missed=10):
+        self.jump = jump
+        self.max_missed = max_missed
+        self.measurement_noise = measurement_noise
+        self.kf = cv2.KalmanFilter(4, 2)
+        self.kf.transitionMatrix = np.array([[1, 0, 1, 0],
+                                             [0, 1, 0, 1],
+                                             [0, 0, 1, 0],
+                                             [0, 0, 0, 1]], dtype=np.float32)
+        self.kf.measurementMatrix = np.eye(2, 4, dtype=np.float32)
+        self.kf.processNoiseCov = np.eye(4, dtype=np.float32) * process_noise
+        self.kf.measurementNoiseCov = np.eye(2, dtype=np.float32) * measurement_noise
+        self._measurement = np.empty((2, 1), dtype=np.float32)
+        self.position = None
+        self.velocity = np.zeros(2)
+        self.missed = 0
+        self.resets = 0
+        self.rejected = 0
+        self._candidate = None
+
+    def resize(self, size):
+        """卡尔曼滤波不使用历史窗口, 保留接口以便与 MovingAverageTracker 互换"""
+
+    def _reset(self, point):
+        self.kf.statePost = np.array([[point[0]], [point[1]], [0], [0]], dtype=np.float32)
+        self.kf.errorCovPost = np.diag([self.measurement_noise, self.measurement_noise, 10, 10]).astype(np.float32)
+        self.resets += 1
+
+    def update(self, point):
+        """输入本帧落点 (缩放坐标) 或 None, 返回滤波后的亚像素位置; 本帧没有落点时返回 None"""
+        if self.position is None:
+            if point is None:
+                return None
+            self._reset(point)
+        else:
+            # predict 同时把预测值写入 statePost, 不校正即等于按匀速外推
+            predicted = self.kf.predict()
+            if point is None:
+                self._candidate = None
+                self.missed += 1
+                if self.missed >= self.max_missed:
+                    self.position = None
+                    self.velocity = np.zeros(2)
+                return None
+            if np.hypot(point[0] - predicted[0, 0], point[1] - predicted[1, 0]) <= self.jump:
+                self._candidate = None
+                self._measurement[0, 0], self._measurement[1, 0] = point
+                self.kf.correct(self._measurement)
+            elif self._candidate is not None and \
+                    np.hypot(point[0] - self._candidate[0], point[1] - self._candidate[1]) <= self.jump:
+                self._candidate = None
+                self._reset(point)
+            else:
+                self._candidate = point
+                self.rejected += 1
+        self.missed = 0
+        state = self.kf.statePost
+        self.position = state[:2, 0].astype(np.float64)
+        self.velocity = state[2:, 0].astype(np.float64)
+        return self.position
+
+
+def create_tracker(params):
+    """按 DetectorParams 创建跟踪器; 跳变阈值按原始分辨率配置, 换算为缩放后像素"""
+    if params.tracker == "kalman":
+        return KalmanTracker(params.kalman_process_noise, params.kalman_measurement_noise,
+                             params.tracker_jump * params.scale)
+    return MovingAverageTracker(params.max_history)
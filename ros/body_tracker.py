@@ -0,0 +1,87 @@
+import time
+
+
+def largest_body(targets, roi_type='body'):
+    """从 PerceptionTargets.targets 中选出面积最大的 body ROI, 返回 (面积, rect); 没有时返回 (0, None)"""
+    rects = [roi.rect for target in targets for roi in target.rois if roi.type == roi_type]
+    if not rects:
+        return 0, None
+    rect = max(rects, key=lambda rect: rect.height * rect.width)
+    return rect.height * rect.width, rect
+
+
+class BodyTracker:
+    """带滞回和最小驻留时间的人体接近状态跟踪
+
+    面积超过 enter_area 才进入 "靠近" 状态, 低于 exit_area 才退出; 状态切换后至少保持
+    min_dwell 秒, 且新状态需连续 confirm_frames 帧成立才生效, 避免阈值附近来回抖动。
+    update 只在状态发生切换时返回新状态 (True/False), 其余返回 None。
+    """
+
+    def __init__(self, enter_area=180000, exit_area=150000, min_dwell=0.5, confirm_frames=2, clock=time.monotonic):
+        if exit_area > enter_area:
+            raise ValueError("exit_area 不能大于 enter_area")
+        self.enter_area = enter_area
+        self.exit_area = exit_area
+        self.min_dwell = min_dwell
+        self.confirm_frames = confirm_frames
+        self.clock = clock
+        self.active = False
+        self.area = 0
+        self.rect = None
+        self.transitions = 0
+        self._changed_at = None
+        self._streak = 0
+
+    def update(self, targets, now=None):
+        area, rect = largest_body(targets)
+        return self.update_area(area, rect, now)
+
+    def update_area(self, area, rect=None, now=None):
+        now = self.clock() if now is None else now
+        self.area = area
+        self.rect = rect
+        wanted = area > self.exit_area if self.active else area > self.enter_area
+        if wanted == self.active:
+            self._streak = 0
+            return None
+        self._streak += 1
+        if self._streak < self.confirm_frames:
+            return None
+        if self._changed_at is not None and now - self._changed_at < self.min_dwell:
+            return None
+        self.active = wanted
+        self._changed_at = now
+        self._streak = 0
+        self.transitions += 1
+        return self.active
+
+
+class BodyDetectionCore:
+    """人体检测回调的核心逻辑, 不依赖 ROS: 输入一帧的 targets (含 rois 的对象列表), 按状态切换驱动舵机
+
+    ROS 节点和离线回放 (replay.py) 都只负责把消息交给 handle, servo 只需提供 set_angle。
+    """
+
+    def __init__(self, servo, tracker=None, log=print, open_angle=80, close_angle=0):
+        self.servo = servo
+        self.tracker = tracker or BodyTracker()
+        self.log = log
+        self.open_angle = open_angle
+        self.close_angle = close_angle
+        self.messages = 0
+
+    def handle(self, targets, now=None):
+        """处理一帧检测结果, 状态切换时返回新状态并发送舵机命令, 否则返回 None"""
+        self.messages += 1
+        state = self.tracker.update(targets, now)
+        if state is None:
+            return None
+        if state:
+            rect = self.tracker.rect
+            self.log(f'Body close, area: {self.tracker.area}, height: {rect.height}, width: {rect.width}')
+            self.servo.set_angle(self.open_angle)
+        else:
+            self.log(f'Body left, area: {self.tracker.area}')
+            self.servo.set_angle(self.close_angle)
+        return state
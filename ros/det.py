@@ -2,47 +2,33 @@
 # python det.py
 
 #!/usr/bin/env python3
-import requests
-import json
 import rclpy
 from rclpy.node import Node
 from ai_msgs.msg import PerceptionTargets
+from servo_client import ServoClient
+from body_tracker import BodyTracker, BodyDetectionCore
+from replay import record_line
 
 import time
+import argparse
 import sys, os
 
-base_url = "http://192.168.144.251"
-
-# 设置舵机角度
-def set_servo_angle(angle):
-    url = f"{base_url}/api/servo?angle={angle}"
-    response = requests.get(url)
-    return response.json()
-
-# 舵机回中
-def center_servo():
-    url = f"{base_url}/api/servo/center"
-    response = requests.get(url)
-    return response.json()
+# 指标层与 optical_flow 共用 (optical_flow/src/metrics.py), 只依赖标准库; 目录不存在时不记录指标
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "optical_flow", "src"))
+try:
+    import metrics
+except ImportError:
+    metrics = None
 
-# 获取状态
-def get_status():
-    url = f"{base_url}/api/status"
-    response = requests.get(url)
-    return response.json()
-
-# 示例并行函数：模拟水流检测循环
-def detect_water_jet_fast_loop():
-    for _ in range(5):  # 运行 5 次
-        print("Detecting water jet...")
-        time.sleep(1)  # 模拟处理时间
-    print("Water jet detection completed.")
+base_url = "http://192.168.144.251"
 
 class BodyDetectionSubscriber(Node):
-    def __init__(self):
+    def __init__(self, servo, recorder=None):
         super().__init__('body_detection_subscriber')
-        self.max_area = 180000
-        self.max_rect = None
+        self.core = BodyDetectionCore(servo, BodyTracker(enter_area=180000, exit_area=150000, min_dwell=0.5),
+                                      log=self.get_logger().info)
+        self.recorder = recorder
+        self.callback_time = metrics.histogram("body_callback_seconds", "人体检测回调耗时") if metrics else None
         self.subscription = self.create_subscription(
             PerceptionTargets,
             '/hobot_mono2d_body_detection',
@@ -52,36 +38,30 @@ class BodyDetectionSubscriber(Node):
         self.get_logger().info('Subscribed to /hobot_mono2d_body_detection topic.')
 
     def callback(self, msg):
-        max_area = 0
-        max_rect = None
-        for target in msg.targets:
-            for roi in target.rois:
-                if roi.type == 'body':
-                    area = roi.rect.height * roi.rect.width
-                    if area > max_area:
-                        max_area = area
-                        max_rect = roi.rect
-        if max_area > self.max_area:
-            # self.max_area = max_area  # 注释掉以保持原始阈值
-            self.max_rect = max_rect
-            self.get_logger().info(
-                f'New max area: {max_area}, '
-                f'height: {self.max_rect.height}, width: {self.max_rect.width}'
-            )
-            set_servo_angle(80)
-        else:
-            status = get_status()
-            print(status)
-            if status['data']['current_angle'] > 0:
-                set_servo_angle(0)
+        # 判定逻辑在 BodyDetectionCore 中, 舵机命令由 ServoClient 后台线程发送, 回调不等待网络
+        start_time = time.perf_counter()
+        if self.recorder is not None:
+            self.recorder.write(record_line(time.time(), msg.targets))
+        self.core.handle(msg.targets)
+        if self.callback_time is not None:
+            self.callback_time.observe(time.perf_counter() - start_time)
 
 def main_det(args=None):
-    status = get_status()
-    if status['data']['current_angle'] != 0:
-        set_servo_angle(0)
+    parser = argparse.ArgumentParser(description="人体检测驱动舵机")
+    parser.add_argument("--record", help="把收到的检测消息录制为 JSONL, 供 replay.py 离线回放")
+    parser.add_argument("--metrics-port", type=int, help="在本机该端口提供 /metrics (Prometheus) 和 /metrics.json")
+    parser.add_argument("--metrics-json", help="退出时把指标写入该 JSON 文件")
+    options, ros_args = parser.parse_known_args(args)
+
+    if metrics is not None:
+        metrics.configure(options.metrics_port, options.metrics_json)
+    servo = ServoClient(base_url, registry=metrics.REGISTRY if metrics else None)
+    servo.sync()
+    servo.set_angle(0)
+    recorder = open(options.record, "a", encoding="utf-8") if options.record else None
 
-    rclpy.init(args=args)
-    node = BodyDetectionSubscriber()
+    rclpy.init(args=sys.argv[:1] + ros_args)
+    node = BodyDetectionSubscriber(servo, recorder)
     try:
         rclpy.spin(node)
     except KeyboardInterrupt:
@@ -89,6 +69,9 @@ def main_det(args=None):
     finally:
         node.destroy_node()
         rclpy.shutdown()
+        servo.close()
+        if recorder is not None:
+            recorder.close()
 
 if __name__ == '__main__':
-    main_det()
\ No newline at end of file
+    main_det()
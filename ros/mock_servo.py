@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# 本地模拟 ESP32 舵机板, 用于在没有硬件时验证舵机链路
+# python mock_servo.py --port 8080 --ws-port 8081 --delay 0.02 --jitter 0.01
+import json
+import time
+import base64
+import random
+import struct
+import socket
+import hashlib
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class MockServo:
+    """模拟舵机板状态: 角度限制在 0-80, 每条命令都按 delay ± jitter 延迟后生效并记录生效时间"""
+
+    def __init__(self, delay=0.0, jitter=0.0, seed=None):
+        self.delay = delay
+        self.jitter = jitter
+        self.current_angle = 0
+        self.demo_mode = False
+        self.log = []  # (生效时间 perf_counter, 角度, 通道 "http"/"ws")
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+
+    def wait(self):
+        """模拟板端处理耗时"""
+        with self._lock:
+            seconds = self.delay + self._random.uniform(-self.jitter, self.jitter)
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def set_angle(self, angle, channel):
+        angle = max(0, min(80, angle))
+        with self._lock:
+            self.current_angle = angle
+            self.log.append((time.perf_counter(), angle, channel))
+        return angle
+
+    def process_command(self, command):
+        """与固件 processCommand 相同的 WebSocket 文本命令"""
+        command = command.strip()
+        if command.startswith("SERVO:"):
+            try:
+                angle = int(command[6:])
+            except ValueError:
+                angle = 0  # 固件 toInt() 解析失败时为 0
+            self.wait()
+            self.set_angle(angle, "ws")
+            return
+        command = command.upper()
+        if command == "IDLE":
+            self.set_angle(0, "ws")
+        elif command == "DEMO_START":
+            self.demo_mode = True
+        elif command == "DEMO_STOP":
+            self.demo_mode = False
+            self.set_angle(0, "ws")
+
+
+class ServoHTTPHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    servo = None  # 由 make_http_server 绑定
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        self.servo.wait()
+        if url.path == "/api/servo":
+            if "angle" not in query:
+                self._reply({"status": "error", "message": "缺少angle参数"}, code=400)
+                return
+            try:
+                angle = int(query["angle"][0])
+            except ValueError:
+                angle = 0
+            # 与固件一致: 响应中返回请求的角度, 实际生效角度被限制在 0-80
+            self.servo.set_angle(angle, "http")
+            self._reply({"status": "success", "angle": angle, "message": f"舵机角度设置为{angle}度"})
+        elif url.path == "/api/servo/center":
+            self.servo.set_angle(0, "http")
+            self._reply({"status": "success", "angle": 0, "message": "舵机已回中"})
+        elif url.path == "/api/status":
+            self._reply({"status": "success", "data": {
+                "current_angle": self.servo.current_angle,
+                "wifi_connected": True,
+                "ip_address": self.server.server_address[0],
+                "servo_count": 2,
+                "demo_mode": self.servo.demo_mode,
+            }})
+        elif url.path == "/api/demo/start":
+            self.servo.demo_mode = True
+            self._reply({"status": "success", "demo_mode": True, "message": "演示模式已启动"})
+        elif url.path == "/api/demo/stop":
+            self.servo.demo_mode = False
+            self.servo.set_angle(0, "http")
+            self._reply({"status": "success", "demo_mode": False, "message": "演示模式已停止"})
+        else:
+            self._reply({"status": "error", "message": "not found"}, code=404)
+
+    def _reply(self, payload, code=200):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_http_server(servo, host="127.0.0.1", port=0):
+    handler = type("BoundServoHTTPHandler", (ServoHTTPHandler,), {"servo": servo})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def _recv_exact(conn, n):
+    data = b""
+    while len(data) < n:
+        chunk = conn.recv(n - len(data))
+        if not chunk:
+            raise ConnectionError("connection closed")
+        data += chunk
+    return data
+
+def _send_frame(conn, opcode, payload=b""):
+    header = bytes([0x80 | opcode])
+    if len(payload) < 126:
+        header += bytes([len(payload)])
+    elif len(payload) < 65536:
+        header += bytes([126]) + struct.pack(">H", len(payload))
+    else:
+        header += bytes([127]) + struct.pack(">Q", len(payload))
+    conn.sendall(header + payload)
+
+def _read_frame(conn):
+    """读取一帧客户端消息, 返回 (opcode, payload); 不支持分片消息 (固件命令都很短)"""
+    first, second = _recv_exact(conn, 2)
+    opcode = first & 0x0F
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack(">H", _recv_exact(conn, 2))[0]
+    elif length == 127:
+        length = struct.unpack(">Q", _recv_exact(conn, 8))[0]
+    mask = _recv_exact(conn, 4) if second & 0x80 else None
+    payload = _recv_exact(conn, length)
+    if mask:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return opcode, payload
+
+
+class MockWebSocketServer:
+    """最小化的 WebSocket 服务端 (仅标准库), 按固件协议接收 SERVO:角度 文本命令, 不回复"""
+
+    def __init__(self, servo, host="127.0.0.1", port=0):
+        self.servo = servo
+        self.sock = socket.create_server((host, port))
+        self.server_address = self.sock.getsockname()
+        self._running = True
+
+    def serve_forever(self):
+        while self._running:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handshake(self, conn):
+        request = b""
+        while b"\r\n\r\n" not in request:
+            chunk = conn.recv(1024)
+            if not chunk:
+                raise ConnectionError("connection closed")
+            request += chunk
+        headers = {}
+        for line in request.decode("latin-1").split("\r\n")[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        accept = base64.b64encode(hashlib.sha1((headers["sec-websocket-key"] + WS_GUID).encode()).digest())
+        conn.sendall(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                     b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+
+    def _handle(self, conn):
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            self._handshake(conn)
+            while True:
+                opcode, payload = _read_frame(conn)
+                if opcode == 0x8:
+                    _send_frame(conn, 0x8, payload[:2])
+                    return
+                if opcode == 0x9:
+                    _send_frame(conn, 0xA, payload)
+                elif opcode == 0x1:
+                    self.servo.process_command(payload.decode("utf-8", "replace"))
+        except (ConnectionError, OSError, KeyError):
+            pass
+        finally:
+            conn.close()
+
+    def shutdown(self):
+        self._running = False
+        self.sock.close()
+
+
+class MockServoBoard:
+    """在后台线程同时运行 HTTP 与 WebSocket 服务, 可在测试/基准脚本中直接启动"""
+
+    def __init__(self, host="127.0.0.1", port=0, ws_port=0, delay=0.0, jitter=0.0, seed=None):
+        self.servo = MockServo(delay, jitter, seed)
+        self.http = make_http_server(self.servo, host, port)
+        self.ws = MockWebSocketServer(self.servo, host, ws_port)
+        self.base_url = f"http://{host}:{self.http.server_address[1]}"
+        self.ws_port = self.ws.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.http.serve_forever, daemon=True).start()
+        threading.Thread(target=self.ws.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.http.shutdown()
+        self.http.server_close()
+        self.ws.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟 ESP32 舵机板 (HTTP + WebSocket)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080, help="HTTP 端口, 真实板子为 80")
+    parser.add_argument("--ws-port", type=int, default=8081, help="WebSocket 端口, 真实板子为 81")
+    parser.add_argument("--delay", type=float, default=0.02, help="每条命令的平均处理延迟 (秒)")
+    parser.add_argument("--jitter", type=float, default=0.01, help="延迟抖动幅度 (秒)")
+    args = parser.parse_args()
+
+    board = MockServoBoard(args.host, args.port, args.ws_port, args.delay, args.jitter).start()
+    print(f"模拟舵机板: {board.base_url} , ws://{args.host}:{board.ws_port}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        board.stop()
+        print(f"共收到 {len(board.servo.log)} 条舵机命令")
+
+if __name__ == "__main__":
+    main()
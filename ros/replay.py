@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# 离线回放人体检测消息, 不依赖 ROS
+# python det.py --record body.jsonl                 # 在机器人上录制
+# python replay.py body.jsonl --speed 0             # 最快速度回放
+# python replay.py body.jsonl --speed 1 --url http://127.0.0.1:8080   # 按录制节奏回放并驱动 (模拟) 舵机
+# python replay.py --generate 3000 synthetic.jsonl  # 生成合成录像
+import json
+import time
+import random
+import argparse
+from types import SimpleNamespace
+
+import numpy as np
+
+from body_tracker import BodyTracker, BodyDetectionCore
+
+
+def record_line(stamp, targets):
+    """把一帧 PerceptionTargets.targets 序列化为一行 JSONL"""
+    return json.dumps({
+        "stamp": stamp,
+        "targets": [
+            {"rois": [{"type": roi.type,
+                       "rect": {"x_offset": roi.rect.x_offset, "y_offset": roi.rect.y_offset,
+                                "height": roi.rect.height, "width": roi.rect.width}}
+                      for roi in target.rois]}
+            for target in targets
+        ],
+    }) + "\n"
+
+def _to_targets(targets):
+    return [SimpleNamespace(rois=[SimpleNamespace(type=roi["type"], rect=SimpleNamespace(**roi["rect"]))
+                                  for roi in target["rois"]])
+            for target in targets]
+
+def load_recording(path):
+    """读取录像, 返回 [(时间戳, targets)], targets 与 ROS 消息一样可以用属性访问"""
+    frames = []
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                record = json.loads(line)
+                frames.append((record["stamp"], _to_targets(record["targets"])))
+    return frames
+
+def generate_recording(path, frames, rate=30, people=5, seed=0):
+    """生成合成录像: 若干人随机走近/走远, 每帧各带一个 body 和一个 face ROI"""
+    rng = random.Random(seed)
+    distance = [rng.uniform(0.2, 1.0) for _ in range(people)]
+    with open(path, "w", encoding="utf-8") as file:
+        for i in range(frames):
+            targets = []
+            for p in range(people):
+                distance[p] = min(1.0, max(0.1, distance[p] + rng.gauss(0, 0.02)))
+                height = int(800 * (1.1 - distance[p]))
+                width = int(height * 0.45)
+                rect = SimpleNamespace(x_offset=100 * p, y_offset=0, height=height, width=width)
+                face = SimpleNamespace(x_offset=100 * p, y_offset=0, height=height // 6, width=width // 2)
+                targets.append(SimpleNamespace(rois=[SimpleNamespace(type="body", rect=rect),
+                                                     SimpleNamespace(type="face", rect=face)]))
+            file.write(record_line(i / rate, targets))
+    print(f"已生成 {frames} 帧合成录像: {path}")
+
+
+class RecordingServo:
+    """不联网的舵机替身, 只记录收到的角度"""
+
+    def __init__(self):
+        self.commands = []
+
+    def set_angle(self, angle):
+        self.commands.append(angle)
+
+    def close(self):
+        pass
+
+
+def replay(frames, core, speed=0.0):
+    """把录像逐帧交给 core.handle
+
+    speed=0 时不等待, 以最快速度回放; 否则按录制时间戳的 1/speed 倍节奏回放。
+    返回每帧的判定耗时 (秒) 和总耗时。
+    """
+    latencies = np.empty(len(frames))
+    start = time.perf_counter()
+    first_stamp = frames[0][0] if frames else 0.0
+    for i, (stamp, targets) in enumerate(frames):
+        if speed > 0:
+            delay = start + (stamp - first_stamp) / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        t0 = time.perf_counter()
+        # 判定时间轴使用录制时间戳, 保证不同回放速度下滞回/驻留行为一致
+        core.handle(targets, now=stamp)
+        latencies[i] = time.perf_counter() - t0
+    return latencies, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="离线回放人体检测录像, 统计回调速度与判定延迟")
+    parser.add_argument("recording")
+    parser.add_argument("--speed", type=float, default=0.0, help="回放倍速, 0 为最快速度")
+    parser.add_argument("--url", help="用 ServoClient 驱动该地址的 (模拟) 舵机, 默认只记录角度")
+    parser.add_argument("--ws-port", type=int, default=81)
+    parser.add_argument("--enter-area", type=int, default=180000)
+    parser.add_argument("--exit-area", type=int, default=150000)
+    parser.add_argument("--min-dwell", type=float, default=0.5)
+    parser.add_argument("--quiet", action="store_true", help="不打印状态切换日志")
+    parser.add_argument("--generate", type=int, metavar="FRAMES", help="生成指定帧数的合成录像到 recording 路径")
+    args = parser.parse_args()
+
+    if args.generate:
+        generate_recording(args.recording, args.generate)
+        return
+
+    frames = load_recording(args.recording)
+    if not frames:
+        print(f"录像为空: {args.recording}")
+        return
+    if args.url:
+        from servo_client import ServoClient
+        servo = ServoClient(args.url, ws_port=args.ws_port)
+    else:
+        servo = RecordingServo()
+    tracker = BodyTracker(args.enter_area, args.exit_area, args.min_dwell)
+    core = BodyDetectionCore(servo, tracker, log=(lambda message: None) if args.quiet else print)
+    try:
+        latencies, elapsed = replay(frames, core, args.speed)
+    finally:
+        servo.close()
+
+    ms = latencies * 1000
+    print(f"{args.recording}: {len(frames)} 帧, {elapsed:.2f} 秒, {len(frames) / elapsed:.0f} 回调/秒, "
+          f"状态切换 {tracker.transitions} 次")
+    print(f"判定延迟: 平均 {ms.mean():.3f} / p50 {np.percentile(ms, 50):.3f} / "
+          f"p95 {np.percentile(ms, 95):.3f} / 最大 {ms.max():.3f} ms")
+
+if __name__ == "__main__":
+    main()
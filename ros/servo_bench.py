@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# 舵机链路基准: 以检测频率驱动舵机客户端, 统计回调阻塞时间、命令生效延迟、吞吐与丢弃
+# python servo_bench.py --rate 30 --duration 10 --delay 0.02 --jitter 0.01
+# python servo_bench.py --url http://192.168.144.251   # 对真实板子测试 (无法统计生效时间)
+import time
+import random
+import argparse
+
+import numpy as np
+import requests
+
+from mock_servo import MockServoBoard
+from servo_client import ServoClient
+
+MODES = ("ws", "http", "legacy")
+
+
+class LegacyServo:
+    """原 det.py 的同步调用方式: 每条消息先 GET /api/status, 角度不同再 GET /api/servo"""
+
+    def __init__(self, base_url, timeout=0.5):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.failed = 0
+
+    def set_angle(self, angle):
+        try:
+            current = requests.get(f"{self.base_url}/api/status", timeout=self.timeout).json()['data']['current_angle']
+            if current != angle:
+                requests.get(f"{self.base_url}/api/servo?angle={angle}", timeout=self.timeout)
+        except requests.RequestException:
+            self.failed += 1
+
+    def close(self):
+        pass
+
+
+def presence_targets(rate, duration, switch_prob, seed=None):
+    """模拟检测结果序列: 有人 (80) / 无人 (0) 以 switch_prob 的概率逐帧切换"""
+    rng = random.Random(seed)
+    angle = 0
+    targets = []
+    for _ in range(int(rate * duration)):
+        if rng.random() < switch_prob:
+            angle = 80 if angle == 0 else 0
+        targets.append(angle)
+    return targets
+
+def drive(servo, targets, rate):
+    """按固定频率逐条调用 set_angle, 返回每次调用的阻塞时间和目标角度变化 (时刻, 角度)"""
+    interval = 1.0 / rate
+    call_times = []
+    changes = []
+    last = None
+    start = time.perf_counter()
+    for i, angle in enumerate(targets):
+        # 调用阻塞超过帧间隔时不再补睡, 后续消息顺延 (相当于 ROS 回调积压)
+        delay = start + i * interval - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        t0 = time.perf_counter()
+        if angle != last:
+            changes.append((t0, angle))
+            last = angle
+        servo.set_angle(angle)
+        call_times.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+    return np.array(call_times), changes, elapsed
+
+def match_changes(changes, log, initial_angle=None):
+    """把每次目标变化与板端生效记录对应: 目标被下一次变化取代前没有生效的计为丢弃"""
+    latencies = []
+    dropped = 0
+    for i, (t_change, angle) in enumerate(changes):
+        if i == 0 and angle == initial_angle:
+            continue  # 板子本来就在该角度, 无需发送
+        t_next = changes[i + 1][0] if i + 1 < len(changes) else float("inf")
+        applied = next((t for t, a, _ in log if t >= t_change and a == angle), None)
+        if applied is None or applied > t_next:
+            dropped += 1
+        else:
+            latencies.append(applied - t_change)
+    return np.array(latencies), dropped
+
+def _ms(samples):
+    if len(samples) == 0:
+        return "n/a"
+    return (f"平均 {np.mean(samples) * 1000:.2f} / p50 {np.percentile(samples, 50) * 1000:.2f} / "
+            f"p95 {np.percentile(samples, 95) * 1000:.2f} / 最大 {np.max(samples) * 1000:.2f} ms")
+
+def run_mode(mode, base_url, ws_port, targets, rate, timeout, board=None):
+    if mode == "legacy":
+        servo = LegacyServo(base_url, timeout)
+    else:
+        servo = ServoClient(base_url, ws_port=ws_port, use_websocket=(mode == "ws"), timeout=timeout)
+        servo.sync()
+    log_start = len(board.servo.log) if board else 0
+    initial_angle = board.servo.current_angle if board else None
+    call_times, changes, elapsed = drive(servo, targets, rate)
+    time.sleep(max(timeout, 0.2))  # 等待最后一条命令发出
+    servo.close()
+
+    print(f"[{mode}] {len(targets)} 条消息, 目标 {rate:.0f} Hz, 实际 {len(targets) / elapsed:.1f} Hz")
+    print(f"  回调阻塞: {_ms(call_times)}")
+    if isinstance(servo, ServoClient):
+        print(f"  已发送 {servo.sent}, 合并 {servo.coalesced}, 失败 {servo.failed}, 重发 {servo.resent}")
+    else:
+        print(f"  失败 {servo.failed}")
+    if board is None:
+        return
+    log = board.servo.log[log_start:]
+    latencies, dropped = match_changes(changes, log, initial_angle)
+    final_ok = board.servo.current_angle == targets[-1]
+    print(f"  板端收到 {len(log)} 条命令 ({len(log) / elapsed:.1f} 条/秒), 目标变化 {len(changes)} 次, "
+          f"未生效即被取代 {dropped} 次, 最终角度{'一致' if final_ok else '不一致'}")
+    print(f"  生效延迟: {_ms(latencies)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="舵机命令延迟/吞吐基准")
+    parser.add_argument("--mode", choices=MODES, nargs="+", default=list(MODES))
+    parser.add_argument("--rate", type=float, default=30, help="检测消息频率 (Hz)")
+    parser.add_argument("--duration", type=float, default=10, help="每种模式运行秒数")
+    parser.add_argument("--switch-prob", type=float, default=0.1, help="每帧有人/无人切换概率")
+    parser.add_argument("--delay", type=float, default=0.02, help="模拟板端处理延迟 (秒)")
+    parser.add_argument("--jitter", type=float, default=0.01, help="模拟板端延迟抖动 (秒)")
+    parser.add_argument("--timeout", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--url", help="对已有板子/模拟服务测试, 不启动本地模拟板")
+    parser.add_argument("--ws-port", type=int, default=81)
+    args = parser.parse_args()
+
+    targets = presence_targets(args.rate, args.duration, args.switch_prob, args.seed)
+    board = None
+    if args.url:
+        base_url, ws_port = args.url, args.ws_port
+    else:
+        board = MockServoBoard(delay=args.delay, jitter=args.jitter, seed=args.seed).start()
+        base_url, ws_port = board.base_url, board.ws_port
+        print(f"模拟舵机板 {base_url}, 延迟 {args.delay * 1000:.0f}±{args.jitter * 1000:.0f} ms")
+    try:
+        for mode in args.mode:
+            run_mode(mode, base_url, ws_port, targets, args.rate, args.timeout, board)
+    finally:
+        if board is not None:
+            board.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+import time
+import threading
+from urllib.parse import urlparse
+
+import requests
+
+try:
+    import websocket  # websocket-client, 可选依赖; 缺失时退回 HTTP
+except ImportError:
+    websocket = None
+
+
+class ServoClient:
+    """非阻塞舵机客户端
+
+    set_angle 只记录目标角度并立即返回, 由后台线程通过常驻 WebSocket (ws://IP:81,
+    SERVO:角度) 发送; 发送前有多条命令时只发最新一条, 与当前目标角度相同的命令直接合并。
+    WebSocket 不可用时退回 HTTP /api/servo (复用连接并带超时)。
+    发送失败时保留目标, retry_interval 秒后重发; WebSocket 写入没有应答, 丢失的命令无从察觉,
+    因此空闲时每 resend_interval 秒重发一次当前目标 (为 0 时不重发), 舵机最终总会到达目标角度。
+    传入 registry (optical_flow/src/metrics.py 的 Registry) 时记录每条命令从 set_angle 到发送完成的耗时、
+    发送本身的耗时 (HTTP 为往返时间, WebSocket 没有应答, 为写入耗时) 以及发送/失败/合并次数。
+    """
+
+    def __init__(self, base_url, ws_port=81, use_websocket=True, timeout=0.5, registry=None,
+                 resend_interval=1.0, retry_interval=0.2):
+        self.base_url = base_url
+        self.ws_url = f"ws://{urlparse(base_url).hostname}:{ws_port}"
+        self.use_websocket = use_websocket and websocket is not None
+        self.timeout = timeout
+        self.resend_interval = resend_interval
+        self.retry_interval = retry_interval
+        self.session = requests.Session()
+        self.current_angle = None  # 最近一次成功发送的角度
+        self.target = None         # 最近一次请求的角度
+        self.sent = 0
+        self.coalesced = 0
+        self.failed = 0
+        self.resent = 0
+        self.last_latency = 0.0
+        self.metrics = None
+        if registry is not None:
+            self.metrics = {
+                "latency": registry.histogram("servo_command_latency_seconds", "set_angle 到命令发送完成的时间"),
+                "ws": registry.histogram("servo_send_seconds", "舵机命令发送耗时", {"transport": "ws"}),
+                "http": registry.histogram("servo_send_seconds", "舵机命令发送耗时", {"transport": "http"}),
+                "sent": registry.counter("servo_commands_total", "舵机命令数", {"result": "sent"}),
+                "failed": registry.counter("servo_commands_total", "舵机命令数", {"result": "failed"}),
+                "coalesced": registry.counter("servo_commands_total", "舵机命令数", {"result": "coalesced"}),
+                "resent": registry.counter("servo_commands_total", "舵机命令数", {"result": "resent"}),
+            }
+        self._ws = None
+        self._pending = None
+        self._pending_since = 0.0
+        self._last_send = 0.0
+        self._last_ok = True
+        self._cond = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def get_status(self):
+        """同步查询 /api/status, 仅用于启动时同步角度等非实时场景"""
+        response = self.session.get(f"{self.base_url}/api/status", timeout=self.timeout)
+        return response.json()
+
+    def sync(self):
+        """从舵机读取当前角度作为本地状态, 失败时保持未知"""
+        try:
+            angle = self.get_status()['data']['current_angle']
+            with self._cond:
+                self.current_angle = angle
+                if self.target is None:
+                    self.target = angle
+        except (requests.RequestException, KeyError, ValueError) as e:
+            print(f"获取舵机状态失败: {e}")
+        return self.current_angle
+
+    def set_angle(self, angle):
+        """提交目标角度, 不等待网络; 与当前目标相同则合并 (已发送、发送中或等待重发)"""
+        with self._cond:
+            if angle == self.target:
+                self._coalesce()
+                return
+            if self._pending is not None:
+                self._coalesce()
+            self.target = angle
+            self._pending = angle
+            self._pending_since = time.perf_counter()
+            self._cond.notify()
+
+    def _coalesce(self):
+        self.coalesced += 1
+        if self.metrics is not None:
+            self.metrics["coalesced"].inc()
+
+    def center(self):
+        self.set_angle(0)
+
+    def _resend_delay(self):
+        """距下一次重发当前目标的秒数; 没有目标或不需要重发时返回 None"""
+        if self.target is None:
+            return None
+        interval = self.resend_interval if self._last_ok else self.retry_interval
+        if not interval:
+            return None
+        return self._last_send + interval - time.perf_counter()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and self._pending is None:
+                    delay = self._resend_delay()
+                    if delay is not None and delay <= 0:
+                        break
+                    self._cond.wait(delay)
+                if not self._running:
+                    return
+                if self._pending is not None:
+                    angle, requested = self._pending, self._pending_since
+                    self._pending = None
+                else:
+                    # 发送失败后的重试, 或空闲时的周期性重发
+                    angle, requested = self.target, None
+            start_time = time.perf_counter()
+            ok = self._send(angle)
+            end_time = time.perf_counter()
+            with self._cond:
+                self._last_send = end_time
+                self._last_ok = ok
+                if ok:
+                    self.last_latency = end_time - start_time
+                    self.sent += 1
+                    self.current_angle = angle
+                else:
+                    self.failed += 1
+                if requested is None:
+                    self.resent += 1
+            if self.metrics is not None:
+                self.metrics["sent" if ok else "failed"].inc()
+                if requested is None:
+                    self.metrics["resent"].inc()
+                elif ok:
+                    self.metrics["latency"].observe(end_time - requested)
+
+    def _send(self, angle):
+        start_time = time.perf_counter()
+        if self.use_websocket:
+            try:
+                if self._ws is None:
+                    self._ws = websocket.create_connection(self.ws_url, timeout=self.timeout)
+                self._ws.send(f"SERVO:{angle}")
+                self._observe("ws", start_time)
+                return True
+            except (OSError, websocket.WebSocketException) as e:
+                if self._last_ok:  # 连续失败重试时只打印第一次
+                    print(f"WebSocket 发送失败, 改用 HTTP: {e}")
+                self._close_ws()
+        start_time = time.perf_counter()
+        try:
+            response = self.session.get(f"{self.base_url}/api/servo", params={"angle": angle}, timeout=self.timeout)
+            self._observe("http", start_time)
+            return response.ok
+        except requests.RequestException as e:
+            if self._last_ok:
+                print(f"设置舵机角度失败: {e}")
+            return False
+
+    def _observe(self, transport, start_time):
+        if self.metrics is not None:
+            self.metrics[transport].observe(time.perf_counter() - start_time)
+
+    def _close_ws(self):
+        if self._ws is not None:
+            try:
+                self._ws.close()
+            except Exception:
+                pass
+            self._ws = None
+
+    def close(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._thread.join(timeout=self.timeout * 2)
+        self._close_ws()
+        self.session.close()
@@ -0,0 +1,70 @@
+# python -m pytest -q ros
+import os
+
+import pytest
+
+from body_tracker import BodyTracker, BodyDetectionCore, largest_body
+from replay import RecordingServo, load_recording, replay
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "testdata", "body_hysteresis.jsonl")
+
+
+@pytest.fixture
+def frames():
+    return load_recording(FIXTURE)
+
+
+def make_core(servo):
+    tracker = BodyTracker(enter_area=180000, exit_area=150000, min_dwell=0.5, confirm_frames=2)
+    return BodyDetectionCore(servo, tracker, log=lambda message: None)
+
+
+def test_largest_body_ignores_other_roi_types(frames):
+    # 第 2 帧有两个人, face ROI 比 body 大但不参与比较
+    area, rect = largest_body(frames[1][1])
+    assert area == 200000
+    assert (rect.height, rect.width) == (400, 500)
+    assert largest_body(frames[-1][1]) == (0, None)
+
+
+def test_replay_transitions(frames):
+    servo = RecordingServo()
+    core = make_core(servo)
+    states = [core.handle(targets, now=stamp) for stamp, targets in frames]
+    assert states == [
+        None,   # 0.0 远
+        None,   # 0.1 超过 enter_area, 但只连续 1 帧
+        None,   # 0.2 回落, 连续计数清零
+        None,   # 0.3 再次超过 enter_area, 连续 1 帧
+        True,   # 0.4 连续 2 帧, 进入靠近状态
+        None,   # 0.5 低于 enter_area 但高于 exit_area, 保持
+        None,   # 0.6 低于 exit_area, 连续 1 帧
+        None,   # 0.7 连续 2 帧, 但距上次切换不足 min_dwell
+        None,   # 0.8 仍不足 min_dwell
+        False,  # 1.0 驻留满 min_dwell, 退出
+        None,   # 1.1 高于 exit_area 但低于 enter_area, 不会重新进入
+        None,   # 1.2 没有人
+    ]
+    assert servo.commands == [80, 0]
+    assert core.tracker.transitions == 2
+    assert core.messages == len(frames)
+
+
+def test_replay_helper_matches_handle(frames):
+    servo = RecordingServo()
+    core = make_core(servo)
+    latencies, _ = replay(frames, core)
+    assert len(latencies) == len(frames)
+    assert servo.commands == [80, 0]
+
+
+def test_confirm_frames_one_switches_immediately():
+    tracker = BodyTracker(enter_area=100, exit_area=50, min_dwell=0, confirm_frames=1)
+    assert tracker.update_area(200, now=0.0) is True
+    assert tracker.update_area(80, now=0.1) is None
+    assert tracker.update_area(10, now=0.2) is False
+
+
+def test_exit_area_above_enter_area_rejected():
+    with pytest.raises(ValueError):
+        BodyTracker(enter_area=100, exit_area=200)